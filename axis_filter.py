@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# One Euro filter (Casiez, Roussel, Vogel 2012) for joystick axes: a low-pass
+# filter whose cutoff frequency grows with the speed of the stick, so noise
+# of a slow or resting stick is smoothed and fast gestures pass with little lag.
+# It doesn't stop cursor creep of a stick resting off center: a low-pass filter
+# keeps a biased rest position, only a larger mouse deadzone (axis_thr) removes it.
+
+import math
+import time
+
+import pygame
+
+
+def _alpha(cutoff, dt):
+    tau = 1 / (2 * math.pi * cutoff)
+    return 1 / (1 + tau / dt)
+
+
+class OneEuroFilter:
+    """
+    Per-axis One Euro filter applied to pygame axis events
+
+    Axis values within center_threshold are passed as an exact 0 and reset
+    the axis, so the keyboard handler still commits keys on the same event.
+    Events of an axis with the same time, read in one batch, are each
+    filtered from the state at the previous time: the last one of them is
+    the sample of that time, the filter isn't stepped once per event.
+    The state of all axes is allocated once.
+    """
+
+    # lower bound for the time between two samples of an axis
+    MIN_DT = 0.001
+
+    def __init__(self, axes, min_cutoff=1.0, beta=5.0, d_cutoff=10.0, center_threshold=0, clock=None):
+        """
+        :param axes: indexes of the axes to filter, other axes pass unchanged
+        :param min_cutoff: cutoff frequency of a resting stick, Hz
+        :param beta: cutoff frequency increase per axis range per second of stick speed
+        :param d_cutoff: cutoff frequency of the speed estimate, Hz
+        :param center_threshold: abs(value) <= center_threshold is centered
+        :param clock: time source, time.perf_counter by default
+        """
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.center_threshold = center_threshold
+        self.clock = time.perf_counter if clock is None else clock
+
+        size = max(axes) + 1
+        self._filtered_axes = [False] * size
+        for axis in axes:
+            self._filtered_axes[axis] = True
+        self._value = [0.0] * size
+        self._speed = [0.0] * size
+        self._time = [None] * size
+        # state at the previous time, the base of the events of the current time
+        self._previous_value = [0.0] * size
+        self._previous_speed = [0.0] * size
+        self._previous_time = [None] * size
+
+    def reset(self, axis):
+        self._value[axis] = 0.0
+        self._speed[axis] = 0.0
+        self._time[axis] = None
+        self._previous_time[axis] = None
+
+    def filter(self, axis, value, t):
+        """Filtered value of an axis at time t, in seconds"""
+        if abs(value) <= self.center_threshold:
+            self.reset(axis)
+            return 0
+        if self._time[axis] != t:
+            self._previous_value[axis] = self._value[axis]
+            self._previous_speed[axis] = self._speed[axis]
+            self._previous_time[axis] = self._time[axis]
+            self._time[axis] = t
+        previous_time = self._previous_time[axis]
+        if previous_time is None:
+            # first sample after the center
+            self._value[axis] = value
+            return value
+
+        dt = max(t - previous_time, self.MIN_DT)
+        previous = self._previous_value[axis]
+        speed = self._previous_speed[axis]
+        speed += _alpha(self.d_cutoff, dt) * ((value - previous) / dt - speed)
+        self._speed[axis] = speed
+        filtered = previous + _alpha(self.min_cutoff + self.beta * abs(speed), dt) * (value - previous)
+        self._value[axis] = filtered
+        return filtered
+
+    def apply(self, event, t=None):
+        """
+        Filter the value of an axis event in place
+
+        :param t: time the event arrived or was recorded, in seconds, clock() by default
+        """
+        if event.type == pygame.JOYAXISMOTION and event.axis < len(self._filtered_axes):
+            if self._filtered_axes[event.axis]:
+                event.value = self.filter(event.axis, event.value, self.clock() if t is None else t)
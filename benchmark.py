@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+import argparse
+import bisect
+import random
+import time
+
+import config
+
+
+def _stick_samples(count, seed=0):
+    """Random stick positions with the same resolution as SDL axis values"""
+    rnd = random.Random(seed)
+    return [
+        (rnd.randint(-32768, 32767) / 32767, rnd.randint(-32768, 32767) / 32767)
+        for _ in range(count)
+    ]
+
+
+def _rate(func, samples, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(samples)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(samples) / best
+
+
+def _get_key_numpy(k, left_right, x, y):
+    """_get_key_exact as it was before the lookup tables, with numpy angle and distance"""
+    import numpy as np
+
+    v0 = np.array([1, 0])
+    v = np.array([x, y])
+    angle = int(round(np.arctan2(np.linalg.det([v, v0]), np.dot(v, v0)) * 4 / np.pi))
+    dist = 2 if np.linalg.norm(v, ord=4) > k.DIST_THR else 1
+    row, col = k.LOOKUP[dist - 1][angle]
+    return k.keyboard_layout[left_right][row][col]
+
+
+def bench_lookup(count=100000, repeat=3):
+    from keyboard_controller import KeyboardControllerEventHandler
+
+    k = KeyboardControllerEventHandler(config=config)
+    samples = _stick_samples(count)
+
+    def reference(samples):
+        for x, y in samples:
+            _get_key_numpy(k, "left", x, y)
+
+    def exact(samples):
+        for x, y in samples:
+            k._get_key_exact("left", x, y)
+
+    def table(samples):
+        for x, y in samples:
+            k._get_key("left", x, y)
+
+    mismatches = sum(k._get_key("left", x, y) != _get_key_numpy(k, "left", x, y) for x, y in samples)
+    before = _rate(reference, samples, repeat)
+    math_exact = _rate(exact, samples, repeat)
+    after = _rate(table, samples, repeat)
+    print('_get_key lookup:')
+    print('  before: {:>12,.0f} events/sec (numpy)'.format(before))
+    print('  exact:  {:>12,.0f} events/sec (math, the fallback of the table)'.format(math_exact))
+    print('  after:  {:>12,.0f} events/sec'.format(after))
+    print('  speedup: {:.1f}x, {} keys differ from before'.format(after / before, mismatches))
+
+
+SAMPLE_TEXT = (
+    'the quick brown fox jumps over the lazy dog, '
+    'pack my box with five dozen liquor jugs. '
+) * 20
+
+
+def _typing_session(text=SAMPLE_TEXT):
+    """Handlers wired like main.py with a fake output and a synthetic typing session"""
+    from main import create_controller
+    from output import RecordingOutput
+    from recording import synthesize_typing
+
+    output = RecordingOutput()
+    joystick, _, mouse, keyboard = create_controller(output, init_controller=False)
+    events = synthesize_typing(text, keyboard, switch_button=config.JOY_BUTTON_SWITCH)
+    return joystick, mouse, keyboard, output, events
+
+
+def bench_replay(repeat=3):
+    from recording import replay
+
+    best = None
+    for _ in range(repeat):
+        joystick, mouse, _, output, events = _typing_session()
+        start = time.perf_counter()
+        replay(events, joystick.process_event, mouse)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    print('replay of a synthetic typing session:')
+    print('  {} events, {} keys sent'.format(len(events), sum(e[0] == 'send' for e in output.events)))
+    print('  {:>12,.0f} events/sec'.format(len(events) / best))
+
+
+def bench_overlay():
+    import io
+
+    from help import AsciiKeyboard
+    from recording import replay
+    from renderer import TerminalRenderer
+
+    joystick, mouse, keyboard, _, events = _typing_session()
+    ascii_keyboard = AsciiKeyboard()
+    stream = io.StringIO()
+    overlay = TerminalRenderer(stream)
+    full_bytes = 0
+    frames = 0
+
+    def on_state_changed(k):
+        nonlocal full_bytes, frames
+        ascii_keyboard.shift, ascii_keyboard.caps_lock, ascii_keyboard.extended = k.shift, k.caps_lock, k.extended
+        ascii_keyboard.highlight = {key: ('[', ']') for key in k.current_key.values() if key}
+        text = str(ascii_keyboard)
+        # what '\033[12F' + full reprint writes
+        full_bytes += len(text) + 6
+        frames += 1
+        overlay.show(text)
+    keyboard.on_state_changed = on_state_changed
+
+    start = time.perf_counter()
+    replay(events, joystick.process_event, mouse)
+    elapsed = time.perf_counter() - start
+    print('keyboard overlay during a synthetic typing session:')
+    print('  {} frames in {:.3f}s'.format(frames, elapsed))
+    print('  full redraw:  {:>10,} chars written'.format(full_bytes))
+    print('  incremental:  {:>10,} chars written'.format(len(stream.getvalue())))
+    print('  render cache hit rate: {:.1%}'.format(ascii_keyboard.cache_hit_rate))
+
+
+def _flood(events, period=0.001, noise=2 / 32767, seed=0):
+    """
+    Add the axis events a DS4 on USB sends: every deflected axis is
+    reported each period with a few units of sensor noise
+    """
+    import pygame
+
+    rnd = random.Random(seed)
+    flooded = []
+    held = {}
+    for (t, event), (next_t, _) in zip(events, events[1:] + [(events[-1][0] + period, None)]):
+        flooded.append((t, event))
+        if event.type == pygame.JOYAXISMOTION:
+            held[event.axis] = event.value
+        t += period
+        while t < next_t:
+            for axis, value in held.items():
+                if value:
+                    flooded.append((t, pygame.event.Event(
+                        pygame.JOYAXISMOTION, joy=0, instance_id=0,
+                        axis=axis, value=value + rnd.choice((-noise, 0, noise))
+                    )))
+            t += period
+    return flooded
+
+
+def bench_coalesce(batch_time=1 / 60):
+    from itertools import groupby
+
+    print('axis event coalescing, noisy synthetic typing session in {:.0f} ms batches:'.format(batch_time * 1000))
+    for coalesce in (False, True):
+        joystick, _, keyboard, output, events = _typing_session()
+        events = _flood(events)
+        joystick.coalesce_threshold = keyboard.axis_thr if coalesce else None
+        redraws = 0
+
+        def on_state_changed(_):
+            nonlocal redraws
+            redraws += 1
+        keyboard.on_state_changed = on_state_changed
+
+        batches = [[event for _, event in batch] for _, batch in groupby(events, lambda e: int(e[0] / batch_time))]
+        start = time.perf_counter()
+        for batch in batches:
+            joystick._process_events(batch)
+        elapsed = time.perf_counter() - start
+        print('  {:<5}{:>7} of {} events handled, {:>5} redraws, {} keys sent, {:.0f} ms'.format(
+            'on:' if coalesce else 'off:', len(events) - joystick.events_dropped, len(events), redraws,
+            sum(e[0] == 'send' for e in output.events), elapsed * 1000
+        ))
+
+
+def bench_classify(count=20000):
+    import pygame
+
+    from gestures import synthesize_gestures
+    from keyboard_controller import KeyboardControllerEventHandler
+    from output import RecordingOutput
+
+    output = RecordingOutput()
+    k = KeyboardControllerEventHandler(config=config, output=output)
+    x, y, _ = synthesize_gestures(k, count)
+    # stick position stream -> the axis events producing it
+    events = [pygame.event.Event(pygame.JOYAXISMOTION, joy=0, instance_id=0, axis=axis, value=value)
+              for i in range(len(x))
+              for axis, value, previous in ((0, x[i], x[i - 1] if i else 0), (1, y[i], y[i - 1] if i else 0))
+              if value != previous]
+
+    start = time.perf_counter()
+    for event in events:
+        k._axis_move_event(event)
+    handler = time.perf_counter() - start
+    start = time.perf_counter()
+    _, keys = k.classify_stream('left', x, y)
+    vectorized = time.perf_counter() - start
+
+    assert list(keys) == [e[1] for e in output.events]
+    print('classification of {} synthetic gestures ({} axis events):'.format(count, len(events)))
+    print('  handler:    {:>12,.0f} gestures/sec'.format(count / handler))
+    print('  vectorized: {:>12,.0f} gestures/sec'.format(count / vectorized))
+
+
+def bench_early_commit(step=0.008):
+    import pygame
+
+    from recording import synthesize_typing
+
+    print('early key commit, synthetic typing session with {:.0f} ms between events:'.format(step * 1000))
+    results = {}
+    for early_commit in (False, True):
+        joystick, _, keyboard, output, _ = _typing_session()
+        keyboard.EARLY_COMMIT = early_commit
+        events = synthesize_typing(SAMPLE_TEXT, keyboard, switch_button=config.JOY_BUTTON_SWITCH, step=step)
+        now = 0
+        keyboard.clock = lambda: now
+
+        sent = []
+        send = output.send
+
+        def timed_send(key):
+            sent.append(now)
+            send(key)
+        output.send = timed_send
+
+        # the gesture starts when the stick leaves the center
+        starts = []
+        position = {}
+        for now, event in events:
+            if event.type == pygame.JOYAXISMOTION and event.axis in keyboard.JOY_AXIS_TO_LR:
+                axes = keyboard.LR_TO_JOY_AXIS[keyboard.JOY_AXIS_TO_LR[event.axis]]
+                if not any(position.get(axis) for axis in axes) and event.value:
+                    starts.append(now)
+                position[event.axis] = event.value
+            joystick.process_event(event)
+        keys = [e[1] for e in output.events if e[0] == 'send']
+        results[early_commit] = keys
+        print('  {:<5}{} keys, {:.1f} ms from leaving the center to the keystroke'.format(
+            'on:' if early_commit else 'off:', len(keys),
+            sum(t - start for t, start in zip(sent, starts)) / len(sent) * 1000
+        ))
+    matching = sum(a == b for a, b in zip(results[False], results[True]))
+    print('  {:.2%} of the keys are the same'.format(matching / len(results[False])))
+
+
+def _mouse_session(mouse, step=0.008, steps=4, hold=0.25, rest=0.2):
+    """
+    Cursor moves with the left stick: to each of 8 directions at 3 deflections, held and back
+
+    :return: (list of (time, event) like read_events, (start, hold start, hold end) time of each move)
+    """
+    import math
+
+    import pygame
+
+    events = []
+    moves = []
+    t = 0
+    for angle in range(8):
+        for deflection in (0.3, 0.6, 1.0):
+            x = round(math.cos(angle * math.pi / 4) * deflection * 32767) / 32767
+            y = round(-math.sin(angle * math.pi / 4) * deflection * 32767) / 32767
+            start = t
+            ramp = [i / steps for i in range(1, steps + 1)]
+            for k in ramp + [None] + ramp[-2::-1] + [0]:
+                if k is None:
+                    moves.append((start, t, t + hold))
+                    t += hold
+                    continue
+                for axis, value in zip(mouse.LEFT_AXIS, (x * k, y * k)):
+                    events.append((t, pygame.event.Event(
+                        pygame.JOYAXISMOTION, joy=0, instance_id=0, axis=axis, value=value
+                    )))
+                t += step
+            t += rest
+    return events, moves
+
+
+def _crossing(times, values, threshold):
+    """First time a value reaches threshold, the last time if it never does"""
+    for t, value in zip(times, values):
+        if value >= threshold:
+            return t
+    return times[-1]
+
+
+def bench_filter(noise=0.05, batch_time=1 / 60):
+    import math
+
+    from axis_filter import OneEuroFilter
+
+    def make_filter(mouse, keyboard, clock=None):
+        return OneEuroFilter(
+            set(mouse.LEFT_AXIS + mouse.RIGHT_AXIS + keyboard.JOY_AXIS),
+            config.AXIS_FILTER_MIN_CUTOFF, config.AXIS_FILTER_BETA, config.AXIS_FILTER_D_CUTOFF,
+            center_threshold=keyboard.axis_thr, clock=clock,
+        )
+
+    # unfiltered; filtered with the time of every event like a replay; filtered
+    # with the time each batch is read like Controller.listen
+    runs = (('off:', False, None), ('on:', True, None), ('on, {:.0f} ms batches:'.format(batch_time * 1000), True, batch_time))
+
+    def arrival_time(t, batch):
+        return t if batch is None else (int(t / batch) + 1) * batch
+
+    def delays(times, reference):
+        shifts = [(t - r) * 1000 for t, r in zip(times, reference)]
+        return sum(shifts) / len(shifts), max(shifts)
+
+    print('One Euro axis filter, noisy synthetic sessions ({:.2f} sensor noise, 1 kHz reports):'.format(noise))
+    print('  typing, delay against unfiltered input:')
+    reference = None
+    for name, filtered, batch in runs:
+        joystick, mouse, keyboard, output, events = _typing_session()
+        events = _flood(events, noise=noise)
+        joystick.axis_filter = make_filter(mouse, keyboard) if filtered else None
+        now = 0
+
+        # a key is highlighted from the first change of current_key showing it, and
+        # selected from the last one, both taken from the stick peaks
+        changes = []
+        redraws = 0
+
+        def on_state_changed(k):
+            nonlocal redraws
+            redraws += 1
+            changes.append((now, set(k.current_key.values())))
+        keyboard.on_state_changed = on_state_changed
+
+        timings = []
+        send = output.send
+
+        def timed_send(key):
+            shown = [t for t, keys in changes if key in keys] or [now]
+            timings.append((shown[0], shown[-1]))
+            changes.clear()
+            send(key)
+        output.send = timed_send
+
+        for now, event in events:
+            joystick.process_event(event, arrival_time(now, batch))
+        keys = ''.join(e[1] for e in output.events if e[0] == 'send')
+        if reference is None:
+            reference = keys, timings
+            print('    {:<22}{} keys, {} redraws'.format(name, len(keys), redraws))
+            continue
+        highlight = delays([t for t, _ in timings], [t for t, _ in reference[1]])
+        selection = delays([t for _, t in timings], [t for _, t in reference[1]])
+        print('    {:<22}{} keys {}, {} redraws, highlight {:.1f} ms (max {:.1f}), selection {:.1f} ms (max {:.1f})'.format(
+            name, len(keys), 'as unfiltered' if keys == reference[0] else 'NOT as unfiltered', redraws,
+            *highlight, *selection
+        ))
+
+    print('  cursor, delay of reaching half / 90% of each unfiltered move, jitter of a held stick:')
+    reference = None
+    for name, filtered, batch in runs:
+        joystick, mouse, keyboard, output, _ = _typing_session()
+        events, move_times = _mouse_session(mouse)
+        starts = [start for start, _, _ in move_times]
+        events = _flood(events, noise=noise)
+        joystick.axis_filter = make_filter(mouse, keyboard) if filtered else None
+
+        # cursor position at every tick of the mouse handler
+        period = 1 / (mouse.MOUSE_INTEGRATOR_RATE or mouse.REFERENCE_RATE)
+        times = []
+        positions = []
+        sticks = []
+        x = y = 0
+        next_tick = 0
+        for t, event in events + [(events[-1][0] + 0.2, None)]:
+            while next_tick <= t:
+                if mouse.is_active:
+                    mouse.main_loop_iteration(period)
+                times.append(next_tick)
+                positions.append((x, y))
+                sticks.append(mouse.axis_state[:2])
+                next_tick += period
+                for _, dx, dy in output.events:
+                    x += dx
+                    y += dy
+                output.events.clear()
+            if event is not None:
+                joystick.process_event(event, arrival_time(t, batch))
+
+        # distance from the start of each move
+        moves = []
+        for start, end in zip(starts, starts[1:] + [times[-1]]):
+            first = bisect.bisect_left(times, start)
+            last = bisect.bisect_left(times, end)
+            x0, y0 = positions[first]
+            moves.append((times[first:last], [math.hypot(px - x0, py - y0) for px, py in positions[first:last]]))
+        # rms deviation from the mean while the stick is held: of the stick
+        # values the mouse handler reads, and of the cursor motion per tick
+        def jitter(samples):
+            deviations = []
+            for _, hold_start, hold_end in move_times:
+                held = samples[bisect.bisect_left(times, hold_start):bisect.bisect_left(times, hold_end)]
+                mean_x = sum(x for x, _ in held) / len(held)
+                mean_y = sum(y for _, y in held) / len(held)
+                deviations += [(x - mean_x) ** 2 + (y - mean_y) ** 2 for x, y in held]
+            return math.sqrt(sum(deviations) / len(deviations))
+        stick_jitter = jitter(sticks)
+        cursor_jitter = jitter([(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(positions, positions[1:])])
+        if reference is None:
+            reference = moves
+            print('    {:<22}jitter {:.4f} stick, {:.2f} px per tick'.format(name, stick_jitter, cursor_jitter))
+            continue
+        half = [_crossing(*move, reference_move[1][-1] / 2) for move, reference_move in zip(moves, reference)]
+        most = [_crossing(*move, reference_move[1][-1] * 0.9) for move, reference_move in zip(moves, reference)]
+        travel = sum(move[1][-1] for move in moves) / sum(move[1][-1] for move in reference)
+        print('    {:<22}jitter {:.4f} stick, {:.2f} px per tick, half {:.1f} ms (max {:.1f}), '
+              '90% {:.1f} ms (max {:.1f}), {:.1%} of the travel'.format(
+                  name, stick_jitter, cursor_jitter,
+                  *delays(half, [_crossing(*move, move[1][-1] / 2) for move in reference]),
+                  *delays(most, [_crossing(*move, move[1][-1] * 0.9) for move in reference]),
+                  travel
+              ))
+
+
+def bench_injection(repeat=3):
+    import os
+
+    from recording import replay
+    from uinput_output import UinputOutput
+
+    joystick, mouse, _, recorded, events = _typing_session()
+    replay(events, joystick.process_event, mouse)
+    calls = recorded.events
+
+    print('uinput injection of a synthetic typing session ({} calls):'.format(len(calls)))
+    fd = os.open(os.devnull, os.O_WRONLY)
+    for buffered in (False, True):
+        output = UinputOutput(fd=fd, buffered=buffered)
+
+        def inject(calls):
+            for op, *args in calls:
+                getattr(output, op)(*args)
+            output.flush()
+        print('  {:<11}{:>12,.0f} calls/sec'.format(
+            'buffered:' if buffered else 'per call:', _rate(inject, calls, repeat)
+        ))
+    os.close(fd)
+
+
+def bench_completion(words=100000, repeat=3):
+    import os
+    import tempfile
+
+    from completion import CompletionTrie, WordCompleter, build
+
+    # random words with zipf-like counts, the text words are frequent
+    rnd = random.Random(0)
+    vocabulary = {word: 1000000 for word in SAMPLE_TEXT.replace(',', ' ').replace('.', ' ').split()}
+    while len(vocabulary) < words:
+        word = ''.join(rnd.choice('etaoinshrdlcumwfgypbvkjxqz'[:rnd.randint(8, 26)])
+                       for _ in range(rnd.randint(2, 12)))
+        vocabulary.setdefault(word, 1000000 // (len(vocabulary) + 1))
+
+    start = time.perf_counter()
+    data = build(list(vocabulary.items()))
+    build_time = time.perf_counter() - start
+    with tempfile.NamedTemporaryFile(suffix='.trie', delete=False) as f:
+        f.write(data)
+    try:
+        start = time.perf_counter()
+        trie = CompletionTrie.load(f.name)
+        load_time = time.perf_counter() - start
+        # the trie without the word list, and with uint32 char, first_child,
+        # child_count and a top list for every node
+        index = len(data) - 4 * (trie.word_count + 1) - len(trie._words)
+        flat = (12 + 4 * trie.top) * trie.node_count
+        completer = WordCompleter(trie)
+
+        def type_text(keys):
+            for key in keys:
+                completer.feed(key)
+
+        keys = ['space' if c == ' ' else c for c in SAMPLE_TEXT]
+        rate = _rate(type_text, keys, repeat)
+    finally:
+        os.unlink(f.name)
+
+    print('word completion, {:,} words:'.format(len(vocabulary)))
+    print('  size:  {:>10,} bytes, the trie {:,} ({:,} with uint32 arrays and a top list per node)'.format(
+        len(data), index, flat))
+    print('         {:,} nodes, {:,} of them with a top list'.format(trie.node_count, trie.top_lists))
+    print('  build: {:>10.1f} s'.format(build_time))
+    print('  load:  {:>10.1f} ms (mmap)'.format(load_time * 1000))
+    print('  feed:  {:>10.1f} us per key'.format(1e6 / rate))
+
+
+def bench_snippets(repeat=3):
+    from snippets import SnippetExpander
+
+    rnd = random.Random(0)
+    keys = ['space' if c == ' ' else c for c in SAMPLE_TEXT]
+    print('snippet expansion while typing:')
+    for count in (10, 1000, 10000):
+        snippets = {}
+        while len(snippets) < count:
+            trigger = ';' + ''.join(rnd.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rnd.randint(2, 6)))
+            snippets[trigger] = trigger.upper()
+        expander = SnippetExpander(snippets)
+        triggers = list(snippets)
+
+        def automaton(keys):
+            for key in keys:
+                expander.feed(key)
+
+        def scan(keys):
+            typed = ''
+            for key in keys:
+                typed = typed[-16:] + (' ' if key == 'space' else key)
+                for trigger in triggers:
+                    if typed.endswith(trigger):
+                        break
+
+        print('  {:>6} snippets: {:>6.2f} us per key, scanning the triggers: {:>8.2f} us'.format(
+            count, 1e6 / _rate(automaton, keys, repeat), 1e6 / _rate(scan, keys, repeat)
+        ))
+
+
+def bench_config(repeat=20):
+    import importlib
+    import os
+    import sys
+    import tempfile
+
+    import compiled_config
+    from keyboard_controller import KeyboardControllerEventHandler
+    from mouse_controller import MouseControllerEventHandler
+    from output import RecordingOutput
+
+    output = RecordingOutput()
+
+    def handlers(settings):
+        KeyboardControllerEventHandler(config=settings, output=output)
+        MouseControllerEventHandler(config=settings, output=output)
+
+    def module(_):
+        del sys.modules['config']
+        handlers(importlib.import_module('config'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'config.json')
+        compiled_config.write_snapshot(compiled_config.compile_config(config), path)
+
+        def snapshot(_):
+            handlers(compiled_config.load(path, compiled_config.CONFIG_PATH))
+
+        print('config and handlers setup at startup:')
+        print('  config.py:   {:>6.2f} ms'.format(1000 / _rate(module, [None], repeat)))
+        print('  config.json: {:>6.2f} ms'.format(1000 / _rate(snapshot, [None], repeat)))
+
+
+def bench_devices(counts=(1, 4, 16), repeat=3):
+    import pygame
+
+    from controller import Controller
+    from main import Device
+    from output import RecordingOutput
+    from recording import synthesize_typing
+
+    print('dispatch of a typing session split over N gamepads:')
+    for count in counts:
+        output = RecordingOutput()
+        joystick = Controller(device_factory=lambda slot: Device(output))
+        for instance_id in range(count):
+            joystick.attach(instance_id)
+        # the session of the first gamepad, every event sent by each gamepad in turn
+        keyboard = joystick.devices[0].keyboard
+        events = []
+        for _, event in synthesize_typing(SAMPLE_TEXT, keyboard, switch_button=config.JOY_BUTTON_SWITCH):
+            attrs = dict(event.__dict__)
+            instance_id = len(events) % count
+            attrs.update(joy=instance_id, instance_id=instance_id)
+            events.append(pygame.event.Event(event.type, **attrs))
+
+        def dispatch(events):
+            for event in events:
+                joystick.process_event(event)
+
+        print('  {:>2} gamepads: {:>12,.0f} events/sec'.format(count, _rate(dispatch, events, repeat)))
+
+
+BENCHMARKS = {
+    'lookup': bench_lookup,
+    'replay': bench_replay,
+    'overlay': bench_overlay,
+    'coalesce': bench_coalesce,
+    'classify': bench_classify,
+    'early_commit': bench_early_commit,
+    'filter': bench_filter,
+    'injection': bench_injection,
+    'completion': bench_completion,
+    'snippets': bench_snippets,
+    'config': bench_config,
+    'devices': bench_devices,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='python-ds4 micro-benchmarks')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='benchmarks to run: {} (default: all)'.format(', '.join(BENCHMARKS)))
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
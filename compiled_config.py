@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Compiled configuration: config.py validated once and saved as a JSON
+# snapshot (config.json) together with what the handlers derive from it,
+# the settings each handler takes and the keyboard lookup cells.
+#
+# configure.py writes both files. main.py loads the snapshot with a single
+# read and recompiles it when config.py changed since, a setting with a
+# wrong name or type is an error instead of leaving the default in place.
+
+import difflib
+import json
+import os
+import runpy
+import types
+
+
+VERSION = 1
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(DIRECTORY, 'config.py')
+SNAPSHOT_PATH = os.path.join(DIRECTORY, 'config.json')
+
+JOY_SETTING_TYPES = ('button', 'axis', 'hat', 'buttons')
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _int(name, value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ConfigError('{} must be an integer, got {!r}'.format(name, value))
+    return value
+
+
+def _index(name, value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ConfigError('{} must be a button or axis index (integer >= 0), got {!r}'.format(name, value))
+    return value
+
+
+def _number(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError('{} must be a number, got {!r}'.format(name, value))
+    return value
+
+
+def _bool(name, value):
+    if not isinstance(value, bool):
+        raise ConfigError('{} must be True or False, got {!r}'.format(name, value))
+    return value
+
+
+def _optional_path(name, value):
+    if value is not None and not isinstance(value, str):
+        raise ConfigError('{} must be a file path or None, got {!r}'.format(name, value))
+    return value
+
+
+def _axes(name, value):
+    if not isinstance(value, (tuple, list)):
+        raise ConfigError('{} must be a tuple of axis indexes, got {!r}'.format(name, value))
+    return tuple(_index('{}[{}]'.format(name, i), axis) for i, axis in enumerate(value))
+
+
+def _joy_setting(name, value):
+    """{'type': 'button' | 'axis', 'value': index}, {'type': 'hat', 'indexes': (x, y)} or {'type': 'buttons', ...}"""
+    if not isinstance(value, dict) or value.get('type') not in JOY_SETTING_TYPES:
+        raise ConfigError("{} must be a dict with 'type' one of {}, got {!r}".format(name, JOY_SETTING_TYPES, value))
+    value = dict(value)
+    if value['type'] in ('button', 'axis'):
+        value['value'] = _index(name + "['value']", value.get('value'))
+    elif value['type'] == 'hat':
+        value['indexes'] = _axes(name + "['indexes']", value.get('indexes'))
+        if len(value['indexes']) != 2:
+            raise ConfigError("{}['indexes'] must be (x, y), got {!r}".format(name, value['indexes']))
+    else:
+        for key, button in value.items():
+            if key != 'type':
+                _index('{}[{!r}]'.format(name, key), button)
+    return value
+
+
+def _layout(name, value):
+    """{'left': 3 rows, 'right': 3 rows}, a row is a string of 5 characters"""
+    if (not isinstance(value, dict) or set(value) != {'left', 'right'} or
+            not all(isinstance(rows, (list, tuple)) and len(rows) == 3 and
+                    all(isinstance(row, str) and len(row) == 5 for row in rows) for rows in value.values())):
+        raise ConfigError("{} must be {{'left': [3 rows], 'right': [3 rows]}} of 5 characters each, got {!r}".format(
+            name, value
+        ))
+    return {stick: list(rows) for stick, rows in value.items()}
+
+
+def _snippets(name, value):
+    if not isinstance(value, dict) or not all(
+            isinstance(trigger, str) and trigger and isinstance(text, str) for trigger, text in value.items()):
+        raise ConfigError('{} must be a dict of non-empty trigger strings to strings, got {!r}'.format(name, value))
+    return dict(value)
+
+
+def _sequence(name, value):
+    if not isinstance(value, (tuple, list)):
+        raise ConfigError('{} must be a tuple, got {!r}'.format(name, value))
+    return tuple(value)
+
+
+def _profiles(name, value):
+    """[{setting: value}, ...], the settings themselves are checked by validate()"""
+    if not isinstance(value, (tuple, list)) or not all(isinstance(profile, dict) for profile in value):
+        raise ConfigError('{} must be a list of dicts of settings, got {!r}'.format(name, value))
+    return list(value)
+
+
+def _like(default):
+    """Validator for a handler class attribute, from the type of its default"""
+    if isinstance(default, bool):
+        return _bool
+    if isinstance(default, int):
+        return _int
+    if isinstance(default, float):
+        return _number
+    if isinstance(default, tuple):
+        return _sequence
+    return VALIDATORS[type(default).__name__]
+
+
+def _type(expected):
+    def validate(name, value):
+        if not isinstance(value, expected):
+            raise ConfigError('{} must be a {}, got {!r}'.format(name, expected.__name__, value))
+        return value
+    return validate
+
+
+# by name, the snapshot records the validator of every setting
+VALIDATORS = {
+    'int': _int,
+    'index': _index,
+    'number': _number,
+    'bool': _bool,
+    'optional_path': _optional_path,
+    'axes': _axes,
+    'joy_setting': _joy_setting,
+    'layout': _layout,
+    'snippets': _snippets,
+    'profiles': _profiles,
+    'sequence': _sequence,
+    'list': _type(list),
+    'dict': _type(dict),
+    'str': _type(str),
+}
+_VALIDATOR_NAMES = {validator: name for name, validator in VALIDATORS.items()}
+
+
+# settings read by main.py, the handler class attributes are added by _schema()
+SCHEMA = {
+    'JOY_BUTTON_SWITCH': _index,
+    'OVERLAY_REFRESH_RATE': _number,
+    'COALESCE_AXIS_EVENTS': _bool,
+    'AXIS_FILTER': _bool,
+    'AXIS_FILTER_MIN_CUTOFF': _number,
+    'AXIS_FILTER_BETA': _number,
+    'AXIS_FILTER_D_CUTOFF': _number,
+    'COMPLETION_DICTIONARY': _optional_path,
+    'COMPLETION_COUNT': _int,
+    'SNIPPETS': _snippets,
+    'PROFILES': _profiles,
+}
+
+
+def _handler_classes():
+    # imported here, the handlers import apply_config from this module
+    from keyboard_controller import KeyboardControllerEventHandler
+    from mouse_controller import MouseControllerEventHandler
+    return KeyboardControllerEventHandler, MouseControllerEventHandler
+
+
+def _schema():
+    """SCHEMA and the settings of the handlers: {name: validator}, {handler class name: names}"""
+    schema = dict(SCHEMA)
+    handlers = {}
+    for cls in _handler_classes():
+        handlers[cls.__name__] = names = []
+        for name in dir(cls):
+            default = getattr(cls, name)
+            if not name.isupper() or callable(default):
+                continue
+            names.append(name)
+            if name in schema:
+                continue
+            if name.startswith('JOY_BUTTON_'):
+                schema[name] = _index
+            elif name.startswith('JOY_') and isinstance(default, dict):
+                schema[name] = _joy_setting
+            elif name.endswith('_AXIS') and isinstance(default, tuple):
+                schema[name] = _axes
+            elif name.endswith('_KEYBOARD_LAYOUT'):
+                schema[name] = _layout
+            else:
+                schema[name] = _like(default)
+    return schema, handlers
+
+
+def validate(settings, schema, source='config.py'):
+    """
+    Check and normalize settings, tuples come back from JSON as lists
+
+    The settings of every profile are checked with the same schema.
+
+    :raise ConfigError: on the first unknown or malformed setting
+    """
+    result = {}
+    for name, value in settings.items():
+        validator = schema.get(name)
+        if validator is None:
+            close = difflib.get_close_matches(name, schema, 1)
+            raise ConfigError('{}: unknown setting {}{}'.format(
+                source, name, ', did you mean {}?'.format(close[0]) if close else ''
+            ))
+        try:
+            result[name] = validator(name, value)
+        except ConfigError as e:
+            raise ConfigError('{}: {}'.format(source, e)) from None
+        if validator is _profiles:
+            # profiles don't nest
+            profile_schema = {name: validator for name, validator in schema.items() if validator is not _profiles}
+            result[name] = [
+                validate(profile, profile_schema, '{} {}[{}]'.format(source, name, i))
+                for i, profile in enumerate(result[name])
+            ]
+    return result
+
+
+def compile_config(config, source_path=CONFIG_PATH):
+    """
+    Validate a config module (or any object with the settings as attributes) into a snapshot
+
+    :return: JSON serializable dict
+    """
+    schema, handlers = _schema()
+    settings = validate({
+        name: getattr(config, name) for name in dir(config)
+        if name.isupper() and not isinstance(getattr(config, name), types.ModuleType)
+    }, schema, os.path.basename(source_path))
+    # validators of the settings present, so the snapshot is checked without importing the handlers
+    present = set(settings).union(*settings.get('PROFILES', ()))
+    schema = {name: _VALIDATOR_NAMES[schema[name]] for name in present}
+
+    keyboard_class = _handler_classes()[0]
+    keyboard = keyboard_class.__new__(keyboard_class)
+    for name in handlers[keyboard_class.__name__]:
+        if name in settings:
+            setattr(keyboard, name, settings[name])
+
+    stat = os.stat(source_path) if os.path.exists(source_path) else None
+    return {
+        'version': VERSION,
+        'source': [stat.st_mtime_ns, stat.st_size] if stat is not None else None,
+        'schema': schema,
+        'settings': settings,
+        'handlers': {
+            cls_name: [name for name in names if name in present] for cls_name, names in handlers.items()
+        },
+        'precompiled': {
+            keyboard_class.__name__: {
+                'precompiled_lookup': [keyboard.DIST_THR, keyboard.LOOKUP_RESOLUTION, keyboard.lookup_cells()],
+            },
+        },
+    }
+
+
+def write_snapshot(snapshot, path=SNAPSHOT_PATH):
+    # write and rename, a concurrent start never reads half a file
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temporary, path)
+
+
+class CompiledConfig:
+    """Settings of a snapshot as attributes, like the config module"""
+
+    def __init__(self, snapshot):
+        self._handlers = snapshot['handlers']
+        self._precompiled = snapshot.get('precompiled', {})
+        self._settings = snapshot['settings']
+        for name, value in self._settings.items():
+            setattr(self, name, value)
+
+    def handler_settings(self, handler):
+        """{attribute: value} to set on a handler"""
+        cls_name = type(handler).__name__
+        # the handler lists include the settings only present in profiles
+        settings = {name: self._settings[name] for name in self._handlers.get(cls_name, ()) if name in self._settings}
+        settings.update(self._precompiled.get(cls_name, {}))
+        return settings
+
+    def profile(self, settings):
+        """CompiledConfig with settings replacing these"""
+        return CompiledConfig({
+            'handlers': self._handlers,
+            'precompiled': self._precompiled,
+            'settings': dict(self._settings, **settings),
+        })
+
+
+def apply_config(handler, config):
+    """
+    Set the handler class attributes present in config
+
+    :param config: CompiledConfig, or a config module which is searched for the attributes
+    """
+    if isinstance(config, CompiledConfig):
+        for name, value in config.handler_settings(handler).items():
+            setattr(handler, name, value)
+        return
+    for attr in dir(config):
+        if hasattr(handler, attr):
+            setattr(handler, attr, getattr(config, attr))
+
+
+def profile(config, index):
+    """
+    Config of the index-th gamepad, PROFILES[index] applied over config
+
+    The keyboard lookup cells are precompiled for the base settings only, a
+    profile changing DIST_THR computes its own when the handler is created.
+
+    :param config: CompiledConfig or config module
+    :return: config itself if there is no profile for the gamepad
+    """
+    profiles = getattr(config, 'PROFILES', ())
+    if index >= len(profiles) or not profiles[index]:
+        return config
+    if isinstance(config, CompiledConfig):
+        return config.profile(profiles[index])
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    settings.update(profiles[index])
+    return types.SimpleNamespace(**settings)
+
+
+def _is_current(snapshot, source_path):
+    if not isinstance(snapshot, dict) or snapshot.get('version') != VERSION:
+        return False
+    if not os.path.exists(source_path):
+        return True
+    stat = os.stat(source_path)
+    return snapshot.get('source') == [stat.st_mtime_ns, stat.st_size]
+
+
+def load(path=SNAPSHOT_PATH, source_path=CONFIG_PATH):
+    """
+    Load the snapshot, compile it again first if it is missing or older than config.py
+
+    :raise ConfigError: if the configuration is malformed
+    """
+    try:
+        with open(path, 'rb') as f:
+            snapshot = json.loads(f.read())
+    except FileNotFoundError:
+        snapshot = None
+    except ValueError as e:
+        raise ConfigError('{}: {}, run configure.py again or delete it'.format(path, e)) from None
+
+    if not _is_current(snapshot, source_path):
+        if not os.path.exists(source_path):
+            raise ConfigError('{} not found, run configure.py'.format(source_path))
+        snapshot = compile_config(types.SimpleNamespace(**runpy.run_path(source_path)), source_path)
+        try:
+            write_snapshot(snapshot, path)
+        except OSError:
+            # a read-only checkout still works, just compiles every start
+            pass
+        return CompiledConfig(snapshot)
+
+    try:
+        schema = {name: VALIDATORS[validator] for name, validator in snapshot['schema'].items()}
+        snapshot['settings'] = validate(snapshot['settings'], schema, os.path.basename(path))
+        return CompiledConfig(snapshot)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ConfigError('{}: malformed snapshot ({!r}), run configure.py again or delete it'.format(path, e)) from None
+
+
+if __name__ == '__main__':
+    import time
+
+    start = time.perf_counter()
+    load()
+    print('{} loaded in {:.1f} ms'.format(os.path.basename(SNAPSHOT_PATH), (time.perf_counter() - start) * 1000))
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Word completion from a frequency ranked dictionary.
+#
+# The dictionary is an array-packed trie built once with
+#   python3 completion.py build words.txt words.trie
+# and mapped into memory as it is, so loading doesn't depend on its size.
+#
+# File format, little endian, every section padded to 4 bytes:
+#   MAGIC, VERSION, HEADER (top size, node count, word count, top lists, char size)
+#   uint16 char[nodes]          code point of the edge leading to the node,
+#                               uint32 if the words have code points above 0xffff
+#   uint16 child_count[nodes]   children are consecutive nodes sorted by char
+#   uint32 child_before[blocks] first child of the first node of the block
+#   uint32 top_bits[blocks]     bit i % 32 of block i // 32 is set if node i has a top list
+#   uint32 top_before[blocks]   top lists of the nodes before the block
+#   int32  top[top lists * top] most frequent words below the node, -1 padded
+#   uint32 offset[words + 1]    utf-8 words, by rank
+#   bytes  words
+#
+# Nodes are numbered breadth first, so the first child of a node is the first
+# child of its block plus the children of the nodes before it in the block.
+# Only nodes ending a word or with other than one child have a top list, the
+# rest share the list of their only child. Blocks are 32 nodes.
+
+import bisect
+import mmap
+import struct
+import sys
+
+from snippets import key_character
+
+
+MAGIC = b'DS4TRIE\0'
+VERSION = 2
+HEADER = struct.Struct('<5I')
+BLOCK = 32
+
+
+def read_word_list(file):
+    """
+    Words and counts of a dictionary file
+
+    Lines are either 'word count' or just 'word', then the words are
+    expected in order of decreasing frequency.
+
+    :return: list of (word, count)
+    """
+    words = {}
+    lines = [line.split() for line in file]
+    lines = [fields for fields in lines if fields]
+    for rank, fields in enumerate(lines):
+        count = int(fields[1]) if len(fields) > 1 else len(lines) - rank
+        word = fields[0].lower()
+        words[word] = words.get(word, 0) + count
+    return list(words.items())
+
+
+def build(words, top=3):
+    """
+    Build the trie file contents
+
+    :param words: list of (word, count)
+    :param top: completions kept per node
+    :return: bytes
+    """
+    ranked = sorted(words, key=lambda item: (-item[1], item[0]))
+
+    # dict trie: node = [children {char: node}, word rank or None]
+    root = [{}, None]
+    for rank, (word, _) in enumerate(ranked):
+        node = root
+        for c in word:
+            node = node[0].setdefault(c, [{}, None])
+        node[1] = rank
+
+    # breadth first numbering makes the children of a node consecutive
+    order = [(root, 0)]
+    first_child = []
+    child_count = []
+    i = 0
+    while i < len(order):
+        node, _ = order[i]
+        first_child.append(len(order))
+        child_count.append(len(node[0]))
+        order.extend((child, ord(c)) for c, child in sorted(node[0].items()))
+        i += 1
+
+    # ranks are frequency order, so the top words of a node are the smallest ranks below it
+    tops = [None] * len(order)
+    for i in range(len(order) - 1, -1, -1):
+        node, _ = order[i]
+        candidates = [] if node[1] is None else [node[1]]
+        for j in range(first_child[i], first_child[i] + child_count[i]):
+            candidates.extend(tops[j])
+        tops[i] = sorted(candidates)[:top]
+
+    # a node without a word and with one child has the top list of the child
+    stored = [node[1] is not None or child_count[i] != 1 for i, (node, _) in enumerate(order)]
+    blocks = (len(order) + BLOCK - 1) // BLOCK
+    child_before = [0] * blocks
+    top_bits = [0] * blocks
+    top_before = [0] * blocks
+    stored_count = 0
+    for i, has_top in enumerate(stored):
+        if i % BLOCK == 0:
+            child_before[i // BLOCK] = first_child[i]
+            top_before[i // BLOCK] = stored_count
+        if has_top:
+            top_bits[i // BLOCK] |= 1 << (i % BLOCK)
+            stored_count += 1
+
+    encoded = [word.encode('utf-8') for word, _ in ranked]
+    offsets = [0]
+    for word in encoded:
+        offsets.append(offsets[-1] + len(word))
+
+    n = len(order)
+    char_type = 'H' if max(c for _, c in order) <= 0xffff else 'I'
+    if max(child_count) > 0xffff:
+        raise ValueError('more than 65535 children of a node')
+    return b''.join((
+        MAGIC, struct.pack('<I', VERSION), HEADER.pack(top, n, len(ranked), stored_count, struct.calcsize(char_type)),
+        _section(char_type, [c for _, c in order]),
+        _section('H', child_count),
+        _section('I', child_before),
+        _section('I', top_bits),
+        _section('I', top_before),
+        _section('i', [rank for t, has_top in zip(tops, stored) if has_top for rank in t + [-1] * (top - len(t))]),
+        _section('I', offsets),
+        b''.join(encoded),
+    ))
+
+
+def _section(typecode, values):
+    """Packed values padded to 4 bytes"""
+    data = struct.pack('<{}{}'.format(len(values), typecode), *values)
+    return data + bytes(-len(data) % 4)
+
+
+class CompletionTrie:
+    """Read-only view of a trie file, see the module description"""
+
+    def __init__(self, data):
+        """
+        :param data: file contents, bytes or mmap
+        """
+        self._data = data
+        view = memoryview(data)
+        if bytes(view[:len(MAGIC)]) != MAGIC or struct.unpack_from('<I', data, len(MAGIC))[0] != VERSION:
+            raise ValueError('not a completion dictionary (version {})'.format(VERSION))
+        position = len(MAGIC) + 4
+        self.top, n, self.word_count, stored_count, char_size = HEADER.unpack_from(data, position)
+        self.node_count = n
+        self.top_lists = stored_count
+        position += HEADER.size
+
+        def section(typecode, size):
+            nonlocal position
+            length = struct.calcsize(typecode) * size
+            array = view[position:position + length].cast(typecode)
+            position += length + -length % 4
+            return array
+
+        blocks = (n + BLOCK - 1) // BLOCK
+        self._char = section('H' if char_size == 2 else 'I', n)
+        self._child_count = section('H', n)
+        self._child_before = section('I', blocks)
+        self._top_bits = section('I', blocks)
+        self._top_before = section('I', blocks)
+        self._top = section('i', stored_count * self.top)
+        self._offset = section('I', self.word_count + 1)
+        self._words = view[position:]
+
+    @classmethod
+    def load(cls, path):
+        """Map a trie file into memory"""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def word(self, rank):
+        return str(self._words[self._offset[rank]:self._offset[rank + 1]], 'utf-8')
+
+    def find(self, prefix):
+        """Node of the prefix, or None"""
+        node = 0
+        for c in prefix:
+            first = self._first_child(node)
+            children = self._char[first:first + self._child_count[node]]
+            i = bisect.bisect_left(children, ord(c))
+            if i == len(children) or children[i] != ord(c):
+                return None
+            node = first + i
+        return node
+
+    def _first_child(self, node):
+        block = node // BLOCK
+        return self._child_before[block] + sum(self._child_count[block * BLOCK:node])
+
+    def _top_index(self, node):
+        """Index of the top list of a node, in the top lists stored"""
+        block, bit = divmod(node, BLOCK)
+        while not self._top_bits[block] >> bit & 1:
+            # no word here and one child, the same words are below it
+            node = self._first_child(node)
+            block, bit = divmod(node, BLOCK)
+        return self._top_before[block] + bin(self._top_bits[block] & ((1 << bit) - 1)).count('1')
+
+    def complete(self, prefix, count=None):
+        """Most frequent words starting with prefix, at most count (the built top size)"""
+        node = self.find(prefix.lower())
+        if node is None:
+            return []
+        if count is None:
+            count = self.top
+        start = self._top_index(node) * self.top
+        words = []
+        for rank in self._top[start:start + min(count, self.top)]:
+            if rank < 0:
+                break
+            words.append(self.word(rank))
+        return words
+
+
+class WordCompleter:
+    """
+    Follows the keys sent by KeyboardControllerEventHandler and offers
+    completions of the word being typed
+    """
+
+    # keys which don't end the word
+    WORD_CHARACTERS = set("abcdefghijklmnopqrstuvwxyz'-")
+
+    def __init__(self, trie, count=3, min_prefix=1):
+        """
+        :param trie: CompletionTrie
+        :param count: number of completions offered
+        :param min_prefix: characters to type before completions are offered
+        """
+        self.trie = trie
+        self.count = count
+        self.min_prefix = min_prefix
+        self.prefix = ''
+        self.completions = []
+
+    def reset(self):
+        self.prefix = ''
+        self.completions = []
+
+    def feed(self, key, shift=False):
+        """
+        Track a key sent by the keyboard handler
+
+        :param key: key name as passed to the output, e.g. 'a', 'shift+a', 'backspace'
+        :param shift: whether shift is held
+        """
+        c = key_character(key, shift)
+        if c is not None and c.lower() in self.WORD_CHARACTERS:
+            self.prefix += c
+        elif key == 'backspace' and self.prefix:
+            self.prefix = self.prefix[:-1]
+        else:
+            self.reset()
+            return
+        if len(self.prefix) >= self.min_prefix:
+            self.completions = [
+                word for word in self.trie.complete(self.prefix, self.count) if len(word) > len(self.prefix)
+            ]
+        else:
+            self.completions = []
+
+    def accept(self, index=0):
+        """
+        Finish the word with a completion
+
+        :return: the characters to type, or None if there is no such completion
+        """
+        if index >= len(self.completions):
+            return None
+        word = self.completions[index]
+        rest = word[len(self.prefix):]
+        if len(self.prefix) > 1 and self.prefix.isupper():
+            rest = rest.upper()
+        self.reset()
+        return rest + ' '
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Build or query a word completion dictionary')
+    commands = parser.add_subparsers(dest='command')
+    build_parser = commands.add_parser('build', help='build a dictionary from a word list')
+    build_parser.add_argument('words', help="word list, 'word count' or one word per line by frequency")
+    build_parser.add_argument('output', help='dictionary file to write')
+    build_parser.add_argument('--top', type=int, default=3, help='completions kept per prefix')
+    query_parser = commands.add_parser('query', help='print the completions of prefixes')
+    query_parser.add_argument('dictionary')
+    query_parser.add_argument('prefixes', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open(args.words, encoding='utf-8') as f:
+            words = read_word_list(f)
+        data = build(words, args.top)
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print('{} words, {:,} bytes'.format(len(words), len(data)))
+    elif args.command == 'query':
+        trie = CompletionTrie.load(args.dictionary)
+        for prefix in args.prefixes:
+            start = time.perf_counter()
+            words = trie.complete(prefix)
+            print('{}: {} ({:.1f} us)'.format(prefix, ' '.join(words), (time.perf_counter() - start) * 1e6))
+    else:
+        parser.print_usage(sys.stderr)
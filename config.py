@@ -2,6 +2,15 @@
 
 JOY_BUTTON_SWITCH = 13
 
+OVERLAY_REFRESH_RATE = 30
+
+COALESCE_AXIS_EVENTS = True
+
+AXIS_FILTER = False
+AXIS_FILTER_MIN_CUTOFF = 1.0
+AXIS_FILTER_BETA = 5.0
+AXIS_FILTER_D_CUTOFF = 10.0
+
 # Mouse
 
 LEFT_AXIS = (0, 1)
@@ -11,6 +20,8 @@ JOY_BUTTON_LEFT_MOUSE_CLICK = 4
 JOY_BUTTON_RIGHT_MOUSE_CLICK = 5
 JOY_SCROLL_MODE = {'type': 'button', 'value': 7}
 
+MOUSE_INTEGRATOR_RATE = 500
+
 # Keyboard
 
 JOY_AXIS = (0, 1, 2, 5)
@@ -27,3 +38,17 @@ JOY_BUTTON_OPTION = 2
 JOY_BUTTON_CTRL = 3
 JOY_BUTTON_ESC = 1
 JOY_ARROWS = {'type': 'hat', 'indexes': (1, 0)}
+JOY_BUTTON_COMPLETE = 9
+
+EARLY_COMMIT = False
+EARLY_COMMIT_RATIO = 0.6
+EARLY_COMMIT_SPEED = 5.0
+
+COMPLETION_DICTIONARY = None
+COMPLETION_COUNT = 3
+
+SNIPPETS = {}
+
+# Gamepads
+
+PROFILES = []
@@ -6,11 +6,13 @@
 # Distributed under terms of the MIT license.
 
 from collections import OrderedDict
+from types import SimpleNamespace
 from typing import Callable
 
 import os
 import pygame
 
+from compiled_config import compile_config, write_snapshot
 from help import AsciiDualShock
 
 
@@ -71,7 +73,7 @@ class Controller:
 
     def listen(self):
         """
-        Start infinite loop over pygame.event.get()
+        Start infinite loop over pygame.event.wait()
 
         Handler can interrupt this loop by throwing InterruptListen exception.
         """
@@ -79,7 +81,8 @@ class Controller:
         self.running = True
         try:
             while self.running:
-                for event in pygame.event.get():
+                event = pygame.event.wait(500)
+                if event.type != pygame.NOEVENT:
                     self.process_event(event)
         except InterruptListen:
             pass
@@ -335,6 +338,21 @@ if __name__ == "__main__":
 
         ('JOY_BUTTON_SWITCH', 13),
 
+        ('!print space switch', "\n"),
+
+        ('OVERLAY_REFRESH_RATE', 30),
+
+        ('!print space coalesce', "\n"),
+
+        ('COALESCE_AXIS_EVENTS', True),
+
+        ('!print space axis filter', "\n"),
+
+        ('AXIS_FILTER', False),
+        ('AXIS_FILTER_MIN_CUTOFF', 1.0),
+        ('AXIS_FILTER_BETA', 5.0),
+        ('AXIS_FILTER_D_CUTOFF', 10.0),
+
         ('!print mouse header', "\n# Mouse\n\n"),
 
         ('LEFT_AXIS', (0, 1)),
@@ -346,6 +364,10 @@ if __name__ == "__main__":
         ('JOY_BUTTON_RIGHT_MOUSE_CLICK', 5),
         ('JOY_SCROLL_MODE', {'type': 'button', 'value': 7}),
 
+        ('!print space mouse integrator', "\n"),
+
+        ('MOUSE_INTEGRATOR_RATE', 500),
+
         ('!print keyboard header', "\n# Keyboard\n\n"),
 
         ('JOY_AXIS', (0, 1, 2, 5)),
@@ -364,6 +386,26 @@ if __name__ == "__main__":
         ('JOY_BUTTON_CTRL', 3),
         ('JOY_BUTTON_ESC', 1),
         ('JOY_ARROWS', {'type': 'hat', 'indexes': (1, 0)}),
+        ('JOY_BUTTON_COMPLETE', 9),
+
+        ('!print space early commit', "\n"),
+
+        ('EARLY_COMMIT', False),
+        ('EARLY_COMMIT_RATIO', 0.6),
+        ('EARLY_COMMIT_SPEED', 5.0),
+
+        ('!print space completion', "\n"),
+
+        ('COMPLETION_DICTIONARY', None),
+        ('COMPLETION_COUNT', 3),
+
+        ('!print space snippets', "\n"),
+
+        ('SNIPPETS', {}),
+
+        ('!print gamepads header', "\n# Gamepads\n\n"),
+
+        ('PROFILES', []),
     ])
 
     def axis_motion_handler(event):
@@ -390,3 +432,6 @@ if __name__ == "__main__":
                 f.write(v)
             else:
                 f.write('{} = {}\n'.format(k, v))
+
+    settings = SimpleNamespace(**{k: v for k, v in config.items() if not k.startswith('!print')})
+    write_snapshot(compile_config(settings, 'config.py'), 'config.json')
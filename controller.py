@@ -14,8 +14,11 @@
 
 import os
 import pprint
+import time
 import pygame
 
+from latency import tracker as latency
+
 
 def merge_event_handlers(*args):
     result = {}
@@ -31,10 +34,130 @@ def merge_event_handlers(*args):
     return result
 
 
+def compile_button_actions(*actions):
+    """
+    Build the button dispatch table of an event handler
+
+    :param actions: (button, press_action, release_action) tuples, the
+                    button is skipped if None and the first entry wins if
+                    a button is listed twice
+    :return: dict mapping button to (press_action, release_action) callables()
+    """
+    result = {}
+    for button, press_action, release_action in actions:
+        if button is not None and button not in result:
+            result[button] = (press_action, release_action)
+    return result
+
+
+# (x axis, y axis) of the sticks of a DualShock 4 in pygame
+DEFAULT_STICKS = ((0, 1), (2, 5))
+
+
+def coalesce_axis_events(events, center_threshold=0, sticks=DEFAULT_STICKS):
+    """
+    Drop stick events of a batch which don't change the outcome of the batch
+
+    A run of a stick lasts from one centered position of both its axes to
+    the next, or to an event which isn't a stick axis. An event of the run
+    is kept if it is a new peak of its axis in the run (abs(value) larger
+    than before), the latest event of its axis in the run, or centers the
+    stick. So the keys selected by the peaks of both axes are the same as
+    for every event, the latest value of every axis and every centered
+    position, which is what commits a key, still reach the handlers. The
+    rest, the way back to the center and sensor noise, is dropped.
+
+    Events of other axes (the triggers) are passed on as they are.
+
+    :param center_threshold: axis values with abs(value) <= center_threshold are centered
+    :param sticks: (x axis, y axis) of each stick
+    :return: list of the events kept, in order
+    """
+    if len(events) < 2:
+        return events
+    # axis -> (stick, 0 for x or 1 for y)
+    stick_axes = {}
+    for stick, axes in enumerate(sticks):
+        for i, axis in enumerate(axes):
+            stick_axes.setdefault(axis, (stick, i))
+
+    # per event: None for other events, the axes of the stick for centered positions,
+    # True for new peaks and False for the other stick events
+    marks = []
+    # (instance_id, stick) -> [abs(x), abs(y)] peaks in the current run, [x, y] values
+    peaks = {}
+    values = {}
+    axis_motion = pygame.JOYAXISMOTION
+    for event in events:
+        stick_axis = stick_axes.get(event.axis) if event.type == axis_motion else None
+        if stick_axis is None:
+            marks.append(None)
+            peaks.clear()
+            continue
+        stick, i = stick_axis
+        key = (event.instance_id, stick)
+        value = event.value
+        magnitude = value if value >= 0 else -value
+        stick_values = values.get(key)
+        if stick_values is None:
+            stick_values = values[key] = [None, None]
+        stick_values[i] = value
+        other = stick_values[1 - i]
+        if magnitude <= center_threshold and (other is None or abs(other) <= center_threshold):
+            marks.append(sticks[stick])
+            peaks.pop(key, None)
+            continue
+        stick_peaks = peaks.get(key)
+        if stick_peaks is None:
+            stick_peaks = peaks[key] = [center_threshold, center_threshold]
+        if magnitude > stick_peaks[i]:
+            stick_peaks[i] = magnitude
+            marks.append(True)
+        else:
+            marks.append(False)
+
+    kept = []
+    # (instance_id, axis) of the later events in the current run
+    later = set()
+    for event, mark in zip(reversed(events), reversed(marks)):
+        if mark is None:
+            later.clear()
+        elif mark is True:
+            later.add((event.instance_id, event.axis))
+        elif mark is False:
+            if (event.instance_id, event.axis) in later:
+                continue
+            later.add((event.instance_id, event.axis))
+        else:
+            # the events before the centered position are another run
+            later.difference_update((event.instance_id, axis) for axis in mark)
+        kept.append(event)
+    kept.reverse()
+    return kept
+
+
 class InterruptListen(Exception):
     pass
 
 
+class PygameInput:
+    """Controller input source reading the pygame (SDL) event queue"""
+
+    def get(self):
+        """All pending events, doesn't block"""
+        return pygame.event.get()
+
+    def wait(self, timeout):
+        """
+        Wait for the next event
+
+        :param timeout: max time to block in ms
+        :return: list with the event, empty on timeout
+        """
+        event = pygame.event.wait(timeout)
+        return [] if event.type == pygame.NOEVENT else [event]
+
+
 class Controller:
     """Class representing the controller"""
 
@@ -43,17 +166,66 @@ class Controller:
         pygame.JOYBUTTONUP, pygame.JOYHATMOTION
     )
 
-    def __init__(self, event_handlers=None, init_controller=False):
+    DEFAULT_TICK_RATE = 60
+    # upper bound for blocking in pygame.event.wait() while idle, in ms,
+    # so the loop still notices self.running changes and KeyboardInterrupt
+    DEFAULT_IDLE_TIMEOUT = 500
+
+    def __init__(self, event_handlers=None, init_controller=False, input_source=None,
+                 coalesce_threshold=None, axis_filter=None, on_disconnect=None, device_factory=None,
+                 coalesce_sticks=DEFAULT_STICKS):
         """
         Initialize the controller
 
         :param event_handlers: map pygame.JOY* event to a list of callables(event)
+        :param input_source: where listen() reads events from, PygameInput by
+                             default, see also evdev_input.EvdevInput
+        :param coalesce_threshold: if not None, listen() drops redundant axis
+                                   events of every batch it reads, see
+                                   coalesce_axis_events()
+        :param coalesce_sticks: (x axis, y axis) of the sticks to coalesce
+        :param axis_filter: object with apply(event) adjusting axis events
+                            before dispatch, see axis_filter.OneEuroFilter
+        :param on_disconnect: callable() run when the gamepad is removed, to
+                              release the keys and buttons the handlers hold
+        :param device_factory: callable(slot) -> handlers of one gamepad, an object
+                               with handlers_dict, axis_filter and release_all().
+                               If given, every gamepad connected is opened and its
+                               events go to its own handlers, see attach(),
+                               event_handlers and axis_filter then only get the
+                               events of gamepads not attached
         """
 
         if event_handlers is None:
             event_handlers = {}
         self.event_handlers = event_handlers
 
+        if input_source is None:
+            input_source = PygameInput()
+        self.input_source = input_source
+
+        self.running = False
+
+        self.coalesce_threshold = coalesce_threshold
+        self.coalesce_sticks = coalesce_sticks
+        # callables(events) getting every batch listen() reads, before coalescing
+        self.batch_listeners = []
+        self.axis_filter = axis_filter
+        self.events_received = 0
+        self.events_dropped = 0
+
+        # the open pygame joystick, None while no gamepad is connected
+        self.controller = None
+        self.on_disconnect = on_disconnect
+
+        self.device_factory = device_factory
+        # handlers by slot, created when a slot is first taken and kept while its gamepad is away
+        self.devices = []
+        # instance id -> (pygame joystick or None, slot) of the attached gamepads
+        self.attached = {}
+        # instance id -> (handlers dict, axis filter), the lookup done for every event
+        self._routes = {}
+
         if init_controller:
             self.init_controller()
 
@@ -63,39 +235,164 @@ class Controller:
 
     def init_controller(self):
         self.init()
-        self.controller = pygame.joystick.Joystick(0)
+        # otherwise the gamepad is opened by the JOYDEVICEADDED event when it is connected
+        if self.device_factory is not None:
+            for device_index in range(pygame.joystick.get_count()):
+                self._device_added(device_index)
+        elif pygame.joystick.get_count():
+            self._device_added(0)
+
+    def attach(self, instance_id, joystick=None):
+        """
+        Route the events of a gamepad to the handlers of the first free slot
+
+        A gamepad connected again gets the slot it had if no other gamepad took
+        it in between, with the handlers' state and config profile of the slot.
+        Called for the gamepads pygame reports, call it for the instance ids of
+        other input sources.
+
+        :param joystick: pygame joystick, closed by detach()
+        :return: slot
+        """
+        if instance_id in self.attached:
+            return self.attached[instance_id][1]
+        taken = {slot for _, slot in self.attached.values()}
+        slot = next(slot for slot in range(len(self.devices) + 1) if slot not in taken)
+        if slot == len(self.devices):
+            self.devices.append(self.device_factory(slot))
+        device = self.devices[slot]
+        self.attached[instance_id] = (joystick, slot)
+        self._routes[instance_id] = (device.handlers_dict, device.axis_filter)
+        return slot
+
+    def detach(self, instance_id):
+        """Stop routing the events of a gamepad, its handlers release what they hold"""
+        if instance_id not in self.attached:
+            return
+        joystick, slot = self.attached.pop(instance_id)
+        del self._routes[instance_id]
+        if joystick is not None:
+            joystick.quit()
+        self.devices[slot].release_all()
+
+    def _device_added(self, device_index):
+        if self.device_factory is not None:
+            joystick = pygame.joystick.Joystick(device_index)
+            joystick.init()
+            # on startup the gamepads opened by init_controller() are reported connected as well
+            self.attach(joystick.get_instance_id(), joystick)
+            return
+        if self.controller is not None:
+            return
+        self.controller = pygame.joystick.Joystick(device_index)
         self.controller.init()
 
+    def _device_removed(self, instance_id):
+        if self.device_factory is not None:
+            self.detach(instance_id)
+            return
+        if self.controller is None or self.controller.get_instance_id() != instance_id:
+            return
+        self.controller.quit()
+        self.controller = None
+        if self.on_disconnect is not None:
+            self.on_disconnect()
+
     @staticmethod
     def _no_action_event_handler(event):
         pass
 
-    def listen(self):
+    def listen(self, on_tick=None, is_active=None, tick_rate=None, idle_timeout=None):
         """
-        Start infinite loop over pygame.event.get()
+        Start event loop which blocks while there is no input
+
+        While is_active() returns True, pending events are processed and
+        on_tick() is called tick_rate times per second. Otherwise the loop
+        sleeps in input_source.wait() until the next event arrives.
 
-        Handler can interrupt this loop by throwing InterruptListen exception.
+        Handler can interrupt this loop by throwing InterruptListen exception
+        or by setting self.running to False.
+
+        :param on_tick: callable() run on every tick while active
+        :param is_active: callable() -> bool, whether fixed-rate ticks are needed
+        :param tick_rate: ticks per second while active
+        :param idle_timeout: max time in ms to block while idle
         """
 
+        if tick_rate is None:
+            tick_rate = self.DEFAULT_TICK_RATE
+        if idle_timeout is None:
+            idle_timeout = self.DEFAULT_IDLE_TIMEOUT
+
+        clock = pygame.time.Clock()
+        self.running = True
         try:
-            while True:
-                for event in pygame.event.get():
-                    self.process_event(event)
+            while self.running:
+                if is_active is not None and is_active():
+                    self._process_events(self.input_source.get())
+                    if on_tick is not None:
+                        if latency.enabled:
+                            latency.begin()
+                        on_tick()
+                    clock.tick(tick_rate)
+                else:
+                    events = self.input_source.wait(idle_timeout)
+                    if events:
+                        self._process_events(events + self.input_source.get())
         except InterruptListen:
             pass
 
-    def process_event(self, event):
+    def _process_events(self, events):
+        for listener in self.batch_listeners:
+            listener(events)
+        if self.coalesce_threshold is not None:
+            received = len(events)
+            events = coalesce_axis_events(events, self.coalesce_threshold, self.coalesce_sticks)
+            self.events_received += received
+            self.events_dropped += received - len(events)
+        arrival = time.perf_counter()
+        if latency.enabled:
+            for event in events:
+                latency.begin(arrival)
+                self.process_event(event, arrival)
+        else:
+            for event in events:
+                self.process_event(event, arrival)
+
+    def process_event(self, event, arrival=None):
         """
         Process given pygame event.
 
         This function can be used for external pygame.event.get() loop.
+
+        The gamepad is opened when it is connected (JOYDEVICEADDED) and closed
+        when it is removed (JOYDEVICEREMOVED), the handlers keep their state
+        in between. With a device_factory the handlers of the gamepad are
+        found by the instance_id of the event, one dict lookup however many
+        gamepads are attached.
+
+        :param arrival: time the event was read or recorded, in seconds, for the axis filter
         """
+        if latency.enabled:
+            latency.stamp('dispatch')
         if event.type in self.possible_events:
-            handlers = self.event_handlers.get(
+            event_handlers = self.event_handlers
+            axis_filter = self.axis_filter
+            if self._routes:
+                route = self._routes.get(event.instance_id)
+                if route is not None:
+                    event_handlers, axis_filter = route
+            if axis_filter is not None:
+                axis_filter.apply(event, arrival)
+            handlers = event_handlers.get(
                 event.type, [self._no_action_event_handler]
             )
             for handler in handlers:
                 handler(event)
+        elif event.type == pygame.JOYDEVICEADDED:
+            self._device_added(event.device_index)
+        elif event.type == pygame.JOYDEVICEREMOVED:
+            self._device_removed(event.instance_id)
 
 
 if __name__ == "__main__":
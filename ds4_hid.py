@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# DualShock 4 input backend decoding HID input reports from /dev/hidraw*.
+#
+# Report layout (offsets for USB report 0x01, Bluetooth report 0x11 has
+# 2 more bytes in front of the same data):
+#
+#   1-4    LX, LY, RX, RY           uint8, 128 is the center
+#   5      d-pad (low nibble, 8 = released), square, cross, circle, triangle
+#   6      L1, R1, L2, R2, share, options, L3, R3
+#   7      PS, touchpad click, counter
+#   8-9    L2, R2 triggers          uint8
+#   13-18  gyro x, y, z             int16
+#   19-24  accelerometer x, y, z    int16
+#   35-42  2 touch points: id (bit 7 set when not touching), x, y (12 bits each)
+#
+# Axes and buttons are numbered in HID usage order, which is how SDL numbers
+# them on macOS, so the default config.py works unchanged.
+
+import fcntl
+import glob
+import os
+import select
+import struct
+
+import pygame
+
+
+USB_REPORT_ID = 0x01
+BT_REPORT_ID = 0x11
+BT_OFFSET = 2
+MAX_REPORT_SIZE = 78
+# Bluetooth sends 10 byte reports with the basic layout until a calibration feature report is read
+MIN_REPORT_SIZE = 10
+
+# report offsets of the axes: X (LX), Y (LY), Z (RX), Rx (L2), Ry (R2), Rz (RY)
+AXES = (1, 2, 3, 8, 9, 4)
+# (offset, mask): square, cross, circle, triangle, L1, R1, L2, R2, share, options, L3, R3, PS, touchpad
+BUTTONS = (
+    (5, 0x10), (5, 0x20), (5, 0x40), (5, 0x80),
+    (6, 0x01), (6, 0x02), (6, 0x04), (6, 0x08), (6, 0x10), (6, 0x20), (6, 0x40), (6, 0x80),
+    (7, 0x01), (7, 0x02),
+)
+# d-pad value -> pygame hat value, 8 and above is released
+HAT_VALUES = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)) + ((0, 0), ) * 8
+MOTION = struct.Struct('<6h')
+MOTION_OFFSET = 13
+TOUCH_OFFSET = 35
+
+DS4_PRODUCTS = ('000005C4', '000009CC', '00000BA0')
+DS4_VENDOR = '0000054C'
+CALIBRATION_FEATURE_REPORT = 0x02
+
+
+def find_ds4():
+    """Path of the first /dev/hidraw* device which is a DualShock 4, or None"""
+    for uevent in sorted(glob.glob('/sys/class/hidraw/hidraw*/device/uevent')):
+        try:
+            with open(uevent) as f:
+                info = dict(line.strip().split('=', 1) for line in f if '=' in line)
+        except OSError:
+            continue
+        # HID_ID=0005:0000054C:000009CC
+        _, vendor, product = (info.get('HID_ID', '::').upper().split(':') + ['', ''])[:3]
+        if vendor == DS4_VENDOR and product in DS4_PRODUCTS:
+            return '/dev/' + uevent.split('/')[4]
+    return None
+
+
+def _request_full_reports(fd):
+    """Reading the calibration feature report makes Bluetooth DS4 send full 0x11 reports"""
+    buf = bytearray(41)
+    buf[0] = CALIBRATION_FEATURE_REPORT
+    # HIDIOCGFEATURE(len) = _IOC(_IOC_WRITE | _IOC_READ, 'H', 0x07, len)
+    try:
+        fcntl.ioctl(fd, (3 << 30) | (len(buf) << 16) | (ord('H') << 8) | 0x07, buf)
+    except OSError:
+        pass
+
+
+class DS4HidInput:
+    """
+    Controller input source decoding DualShock 4 HID reports
+
+    Reports are read into a preallocated buffer and compared with the
+    previous one, only axes, buttons and the hat that changed produce
+    events. Gyro, accelerometer and touchpad are decoded into the
+    gyro, accel and touch attributes, which are updated in place.
+    """
+
+    def __init__(self, path=None, fd=None, instance_id=0):
+        """
+        :param path: hidraw device path, the first DualShock 4 found if neither path nor fd is given
+        :param fd: already opened file descriptor, e.g. a pipe replaying a capture
+        """
+        if fd is None:
+            if path is None:
+                path = find_ds4()
+                if path is None:
+                    raise OSError('no DualShock 4 found in /dev/hidraw*')
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            _request_full_reports(fd)
+        else:
+            os.set_blocking(fd, False)
+        self.fd = fd
+        self.instance_id = instance_id
+
+        self._report = bytearray(MAX_REPORT_SIZE)
+        self._view = memoryview(self._report)
+        # report data from the axes up to the PS button, in USB offsets, 0 is unused
+        self._previous = bytearray(10)
+        self._previous[1:5] = b'\x80\x80\x80\x80'
+        self._previous[5] = 0x08
+
+        self.gyro = [0, 0, 0]
+        self.accel = [0, 0, 0]
+        # (touching, x, y) of the 2 touch points
+        self.touch = [[False, 0, 0], [False, 0, 0]]
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def get(self):
+        """Decode all pending reports, doesn't block"""
+        events = []
+        while True:
+            try:
+                size = os.readv(self.fd, [self._report])
+            except BlockingIOError:
+                break
+            if not size:
+                break
+            self.decode(self._view[:size], events)
+        return events
+
+    def wait(self, timeout):
+        """
+        Wait for reports and decode them
+
+        :param timeout: max time to block in ms
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout / 1000)
+        return self.get() if readable else []
+
+    def decode(self, report, events):
+        """Decode one report, append events for the changes to events"""
+        if len(report) < MIN_REPORT_SIZE:
+            return
+        if report[0] == BT_REPORT_ID and len(report) >= MAX_REPORT_SIZE:
+            offset = BT_OFFSET
+        elif report[0] == USB_REPORT_ID:
+            offset = 0
+        else:
+            return
+        previous = self._previous
+        instance_id = self.instance_id
+
+        for axis, i in enumerate(AXES):
+            value = report[i + offset]
+            if value != previous[i]:
+                previous[i] = value
+                events.append(pygame.event.Event(
+                    pygame.JOYAXISMOTION, joy=instance_id, instance_id=instance_id,
+                    axis=axis, value=value * 2 / 255 - 1
+                ))
+
+        hat = report[5 + offset] & 0x0f
+        if hat != previous[5] & 0x0f:
+            events.append(pygame.event.Event(
+                pygame.JOYHATMOTION, joy=instance_id, instance_id=instance_id,
+                hat=0, value=HAT_VALUES[hat]
+            ))
+
+        for i in (5, 6, 7):
+            changed = (report[i + offset] ^ previous[i]) & (0xf0 if i == 5 else 0xff)
+            if changed:
+                for button, (button_offset, mask) in enumerate(BUTTONS):
+                    if button_offset == i and changed & mask:
+                        events.append(pygame.event.Event(
+                            pygame.JOYBUTTONDOWN if report[i + offset] & mask else pygame.JOYBUTTONUP,
+                            joy=instance_id, instance_id=instance_id, button=button
+                        ))
+            previous[i] = report[i + offset]
+
+        if len(report) >= TOUCH_OFFSET + offset + 8:
+            self.gyro[0], self.gyro[1], self.gyro[2], self.accel[0], self.accel[1], self.accel[2] = (
+                MOTION.unpack_from(report, MOTION_OFFSET + offset)
+            )
+            for point, i in zip(self.touch, (TOUCH_OFFSET + offset, TOUCH_OFFSET + offset + 4)):
+                point[0] = not report[i] & 0x80
+                point[1] = report[i + 1] | (report[i + 2] & 0x0f) << 8
+                point[2] = report[i + 2] >> 4 | report[i + 3] << 4
+
+
+def read_capture(data):
+    """Split raw hidraw output (e.g. from cat /dev/hidraw0) into reports"""
+    reports = []
+    i = 0
+    while i < len(data):
+        size = MAX_REPORT_SIZE if data[i] == BT_REPORT_ID else 64
+        reports.append(data[i:i + size])
+        i += size
+    return reports
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print DualShock 4 events decoded from hidraw')
+    parser.add_argument('device', nargs='?', help='hidraw device, the first DualShock 4 found by default')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='decode a capture (e.g. made with cat /dev/hidraw0 > FILE) instead')
+    args = parser.parse_args()
+
+    if args.replay:
+        r, w = os.pipe()
+        source = DS4HidInput(fd=r)
+        with open(args.replay, 'rb') as f:
+            data = f.read()
+        # a pipe doesn't keep report boundaries, so pass one report at a time like hidraw does
+        for report in read_capture(data):
+            os.write(w, report)
+            for event in source.get():
+                print(event)
+    else:
+        source = DS4HidInput(args.device)
+        while True:
+            for event in source.wait(1000):
+                print(event)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Linux input backend reading /dev/input/event* directly, without SDL.
+#
+# EV_ABS / EV_KEY events are translated into pygame JOY* events numbered
+# like SDL numbers them, so the same config.py works with both backends:
+# axes and buttons are indexed in the order of their codes among the ones
+# the device supports, the first two hat axes form hat 0.
+
+import fcntl
+import glob
+import os
+import select
+import struct
+
+import pygame
+
+
+# struct input_event {struct timeval time; __u16 type; __u16 code; __s32 value;}
+INPUT_EVENT = struct.Struct('llHHi')
+# struct input_absinfo {__s32 value, minimum, maximum, fuzz, flat, resolution;}
+INPUT_ABSINFO = struct.Struct('6i')
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
+ABS_HAT0X = 0x10
+ABS_HAT0Y = 0x11
+ABS_MAX = 0x3f
+KEY_MAX = 0x2ff
+BTN_MISC = 0x100
+BTN_JOYSTICK = 0x120
+BTN_GAMEPAD = 0x130
+
+# what the kernel reports for a DualShock 4, used when the device can't be queried (e.g. a pipe)
+DS4_ABS = (0x00, 0x01, 0x02, 0x03, 0x04, 0x05, ABS_HAT0X, ABS_HAT0Y)
+DS4_KEYS = (0x130, 0x131, 0x133, 0x134, 0x136, 0x137, 0x138, 0x139, 0x13a, 0x13b, 0x13c, 0x13d, 0x13e)
+DS4_ABSINFO = {code: (0, 255) for code in DS4_ABS[:6]}
+DS4_ABSINFO.update({ABS_HAT0X: (-1, 1), ABS_HAT0Y: (-1, 1)})
+
+
+def _ioc_read(nr, size):
+    # _IOC(_IOC_READ, 'E', nr, size)
+    return (2 << 30) | (size << 16) | (ord('E') << 8) | nr
+
+
+def _eviocgbit(fd, ev, max_code):
+    """Codes of event type ev supported by the device"""
+    buf = bytearray((max_code + 8) // 8)
+    fcntl.ioctl(fd, _ioc_read(0x20 + ev, len(buf)), buf)
+    return tuple(code for code in range(max_code + 1) if buf[code // 8] & (1 << (code % 8)))
+
+
+def _eviocgabs(fd, code):
+    """(minimum, maximum) of an absolute axis"""
+    buf = bytearray(INPUT_ABSINFO.size)
+    fcntl.ioctl(fd, _ioc_read(0x40 + code, len(buf)), buf)
+    _, minimum, maximum, _, _, _ = INPUT_ABSINFO.unpack(buf)
+    return minimum, maximum
+
+
+def find_gamepad():
+    """Path of the first /dev/input/event* device with gamepad buttons, or None"""
+    for path in sorted(glob.glob('/dev/input/event*'), key=lambda p: int(p[len('/dev/input/event'):])):
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            continue
+        try:
+            if BTN_GAMEPAD in _eviocgbit(fd, EV_KEY, KEY_MAX):
+                return path
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return None
+
+
+class EvdevInput:
+    """
+    Controller input source reading a Linux evdev device
+
+    Reads are non-blocking and batched: everything available is read in
+    chunks of READ_EVENTS input events and translated at once.
+    """
+
+    READ_EVENTS = 64
+
+    def __init__(self, path=None, fd=None, instance_id=0):
+        """
+        :param path: device path, the first gamepad found if neither path nor fd is given
+        :param fd: already opened file descriptor, e.g. a pipe replaying a capture
+        """
+        if fd is None:
+            if path is None:
+                path = find_gamepad()
+                if path is None:
+                    raise OSError('no gamepad found in /dev/input')
+            fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        else:
+            os.set_blocking(fd, False)
+        self.fd = fd
+        self.instance_id = instance_id
+
+        try:
+            abs_codes = _eviocgbit(fd, EV_ABS, ABS_MAX)
+            key_codes = _eviocgbit(fd, EV_KEY, KEY_MAX)
+            absinfo = {code: _eviocgabs(fd, code) for code in abs_codes}
+        except OSError:
+            abs_codes, key_codes, absinfo = DS4_ABS, DS4_KEYS, DS4_ABSINFO
+
+        # SDL order: axes by code except hats, buttons from BTN_JOYSTICK up, then BTN_MISC up
+        axes = [code for code in abs_codes if not ABS_HAT0X <= code <= 0x17]
+        buttons = ([code for code in key_codes if code >= BTN_JOYSTICK] +
+                   [code for code in key_codes if BTN_MISC <= code < BTN_JOYSTICK])
+        self.axes = {code: i for i, code in enumerate(axes)}
+        self.buttons = {code: i for i, code in enumerate(buttons)}
+        # code -> (offset, scale) mapping [minimum, maximum] to [-1, 1]
+        self._axis_scale = {}
+        for code in axes:
+            minimum, maximum = absinfo.get(code, (-1, 1))
+            if maximum > minimum:
+                self._axis_scale[code] = (minimum, 2 / (maximum - minimum))
+
+        self.hat = [0, 0]
+        self._buffer = b''
+        self._dropped = False
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def get(self):
+        """Translate all pending input events, doesn't block"""
+        chunks = []
+        while True:
+            try:
+                data = os.read(self.fd, INPUT_EVENT.size * self.READ_EVENTS)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            chunks.append(data)
+            if len(data) < INPUT_EVENT.size * self.READ_EVENTS:
+                break
+        if not chunks:
+            return []
+
+        data = self._buffer + b''.join(chunks)
+        complete = len(data) - len(data) % INPUT_EVENT.size
+        self._buffer = data[complete:]
+        return self.translate(memoryview(data)[:complete])
+
+    def wait(self, timeout):
+        """
+        Wait for input and translate it
+
+        :param timeout: max time to block in ms
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout / 1000)
+        return self.get() if readable else []
+
+    def translate(self, data):
+        """Translate raw input_event structs into pygame JOY* events"""
+        events = []
+        instance_id = self.instance_id
+        for _, _, ev_type, code, value in INPUT_EVENT.iter_unpack(data):
+            if ev_type == EV_SYN:
+                if code == SYN_DROPPED:
+                    # the kernel buffer overflowed, skip the rest of the frame
+                    self._dropped = True
+                elif code == SYN_REPORT:
+                    self._dropped = False
+            elif self._dropped:
+                continue
+            elif ev_type == EV_ABS:
+                if code == ABS_HAT0X or code == ABS_HAT0Y:
+                    # pygame hat y is positive up, evdev is positive down
+                    self.hat[code - ABS_HAT0X] = value if code == ABS_HAT0X else -value
+                    events.append(pygame.event.Event(
+                        pygame.JOYHATMOTION, joy=instance_id, instance_id=instance_id,
+                        hat=0, value=tuple(self.hat)
+                    ))
+                elif code in self.axes:
+                    minimum, scale = self._axis_scale.get(code, (-1, 1))
+                    events.append(pygame.event.Event(
+                        pygame.JOYAXISMOTION, joy=instance_id, instance_id=instance_id,
+                        axis=self.axes[code], value=(value - minimum) * scale - 1
+                    ))
+            elif ev_type == EV_KEY and code in self.buttons and value != 2:
+                # value 2 is autorepeat
+                events.append(pygame.event.Event(
+                    pygame.JOYBUTTONDOWN if value else pygame.JOYBUTTONUP,
+                    joy=instance_id, instance_id=instance_id, button=self.buttons[code]
+                ))
+        return events
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print gamepad events read from evdev')
+    parser.add_argument('device', nargs='?', help='device path, the first gamepad found by default')
+    parser.add_argument('--capture', metavar='FILE', help='also save the raw input_event stream to FILE')
+    parser.add_argument('--replay', metavar='FILE', help='translate a stream saved with --capture instead')
+    args = parser.parse_args()
+
+    if args.replay:
+        r, w = os.pipe()
+        source = EvdevInput(fd=r)
+        with open(args.replay, 'rb') as f:
+            data = f.read()
+        # the pipe buffer is limited, feed it in chunks
+        while data:
+            written = os.write(w, data[:4096])
+            data = data[written:]
+            for event in source.get():
+                print(event)
+    else:
+        source = EvdevInput(args.device)
+        capture = open(args.capture, 'wb') if args.capture else None
+        while True:
+            select.select([source], [], [])
+            data = os.read(source.fd, INPUT_EVENT.size * source.READ_EVENTS)
+            if capture is not None:
+                capture.write(data)
+                capture.flush()
+            for event in source.translate(data):
+                print(event)
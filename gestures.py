@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Offline evaluation of the stick gesture -> key classification, for tuning
+# KeyboardControllerEventHandler.DIST_THR and the axis deadzone.
+#
+# Gestures are whole-array stick position streams classified with
+# KeyboardControllerEventHandler.classify_stream, which commits the same
+# keys as feeding the events to the handler one by one.
+
+import argparse
+
+import numpy as np
+import pygame
+
+
+def synthesize_gestures(keyboard, count, angle_noise=0.12, radius_noise=0.08, steps=4, seed=0):
+    """
+    Random noisy gestures to random keys of the left stick
+
+    Every gesture moves the stick from the center to the key (0.55 or 1.0
+    of the L4 norm, with gaussian angle and radius errors) in steps axis
+    events per axis, alternating x and y like SDL reports them, and back.
+
+    :return: (x, y, (index of the last sample of every gesture, intended keys)),
+             x and y are the stick positions after every event
+    """
+    rnd = np.random.default_rng(seed)
+    outer = rnd.integers(0, 2, count)
+    sector = rnd.integers(0, 8, count)
+    layout = keyboard.DEFAULT_KEYBOARD_LAYOUT['left']
+    keys = np.array([[layout[row][col] for row, col in cells] for cells in keyboard.LOOKUP])[outer, sector]
+
+    angle = sector * np.pi / 4 + rnd.normal(0, angle_noise, count)
+    cos, sin = np.cos(angle), -np.sin(angle)
+    radius = np.where(outer, 1.0, 0.55) * (1 + rnd.normal(0, radius_noise, count))
+    # the stick travel is a square
+    scale = np.minimum(radius / (cos ** 4 + sin ** 4) ** 0.25, 1 / np.maximum(np.abs(cos), np.abs(sin)))
+    target_x = np.round(cos * scale * 32767) / 32767
+    target_y = np.round(sin * scale * 32767) / 32767
+
+    ramp = np.arange(1, steps + 1) / steps
+    ramp = np.concatenate((ramp, ramp[-2::-1], [0]))
+    # every ramp step is an x event then a y event
+    x_ramp = np.repeat(ramp, 2)
+    y_ramp = np.concatenate(([0], np.repeat(ramp, 2)[:-1]))
+    x = (target_x[:, None] * x_ramp).ravel()
+    y = (target_y[:, None] * y_ramp).ravel()
+    ends = np.arange(1, count + 1) * len(x_ramp) - 1
+
+    # like SDL, only report changes
+    changed = np.empty(len(x), dtype=bool)
+    changed[0] = x[0] != 0 or y[0] != 0
+    changed[1:] = (x[1:] != x[:-1]) | (y[1:] != y[:-1])
+    ends = np.cumsum(changed)[ends] - 1
+    return x[changed], y[changed], (ends, keys)
+
+
+def stick_streams(events, keyboard):
+    """
+    Stick position streams of a recording, see recording.read_events
+
+    :return: {left_right: (x, y)}, positions after every axis event of the stick
+    """
+    axis_events = [event for _, event in events if event.type == pygame.JOYAXISMOTION]
+    axes = np.array([event.axis for event in axis_events], dtype=np.intp)
+    values = np.array([event.value for event in axis_events], dtype=float)
+
+    streams = {}
+    for left_right, stick_axes in keyboard.LR_TO_JOY_AXIS.items():
+        mask = np.isin(axes, stick_axes)
+        stick, stick_values = axes[mask], values[mask]
+        position = []
+        for axis in stick_axes:
+            # forward fill the last value of each axis
+            own = np.flatnonzero(stick == axis)
+            last = np.full(len(stick), -1)
+            last[own] = own
+            last = np.maximum.accumulate(last)
+            position.append(np.where(last >= 0, stick_values[np.maximum(last, 0)], 0))
+        streams[left_right] = tuple(position)
+    return streams
+
+
+def sweep(keyboard, x, y, reference, dist_thrs, axis_thrs, left_right='left'):
+    """
+    Mis-selection rates of the gestures for every setting
+
+    A gesture is mis-selected if no key or a different one is committed at
+    its last sample.
+
+    :param reference: (index of the last sample of every gesture, intended keys),
+                      or None to compare with the keys of the current settings
+    :return: {(dist_thr, axis_thr): (keys committed, mis-selection rate)}
+    """
+    if reference is None:
+        reference = keyboard.classify_stream(left_right, x, y)
+    reference_commits, intended = reference
+    results = {}
+    for dist_thr in dist_thrs:
+        for axis_thr in axis_thrs:
+            commits, keys = keyboard.classify_stream(left_right, x, y, dist_thr=dist_thr, axis_thr=axis_thr)
+            if np.array_equal(commits, reference_commits):
+                errors = np.count_nonzero(keys != intended)
+            else:
+                # the deadzone changed where gestures end
+                _, i, j = np.intersect1d(commits, reference_commits, assume_unique=True, return_indices=True)
+                errors = np.count_nonzero(keys[i] != intended[j]) + len(intended) - len(j)
+            results[dist_thr, axis_thr] = (len(keys), errors / len(intended) if len(intended) else 0)
+    return results
+
+
+if __name__ == '__main__':
+    import time
+
+    import config
+    from keyboard_controller import KeyboardControllerEventHandler
+    from output import RecordingOutput
+    from recording import read_events
+
+    parser = argparse.ArgumentParser(description='Mis-selection rates of stick gestures for DIST_THR / deadzone values')
+    parser.add_argument('recording', nargs='?',
+                        help='recording made with main.py --record, compared with the current settings; '
+                             'synthetic noisy gestures with known keys by default')
+    parser.add_argument('--gestures', type=int, default=1000000, help='number of synthetic gestures')
+    parser.add_argument('--angle-noise', type=float, default=0.12, help='stddev of the gesture angle, radians')
+    parser.add_argument('--radius-noise', type=float, default=0.08, help='relative stddev of the gesture length')
+    parser.add_argument('--dist-thr', type=float, nargs='+', default=[0.8, 0.85, 0.9, 0.95])
+    parser.add_argument('--axis-thr', type=float, nargs='+', default=[0.008, 0.02, 0.05])
+    args = parser.parse_args()
+
+    keyboard = KeyboardControllerEventHandler(config=config, output=RecordingOutput())
+    start = time.perf_counter()
+    if args.recording:
+        with open(args.recording, 'rb') as f:
+            x, y = stick_streams(read_events(f), keyboard)['left']
+        reference = None
+    else:
+        x, y, reference = synthesize_gestures(keyboard, args.gestures, args.angle_noise, args.radius_noise)
+    results = sweep(keyboard, x, y, reference, args.dist_thr, args.axis_thr)
+    elapsed = time.perf_counter() - start
+
+    print('{} samples, {} settings in {:.1f}s'.format(len(x), len(results), elapsed))
+    print('{:>10}{:>10}{:>10}{:>14}'.format('dist_thr', 'axis_thr', 'keys', 'mis-selected'))
+    for (dist_thr, axis_thr), (count, rate) in results.items():
+        print('{:>10}{:>10}{:>10}{:>14.2%}'.format(dist_thr, axis_thr, count, rate))
@@ -4,8 +4,11 @@
 # Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
 #
 # Distributed under terms of the MIT license.
+import functools
 import platform
 
+from collections import OrderedDict
+
 if platform.system() == 'Windows':
     RETURN_TEXT = 'Enter'
 else:
@@ -50,8 +53,19 @@ class AsciiKeyboard:
     SPACE_KEY = SpecialKey(' ', '<Space>', 26)
 
     PADDING = 1
+    # number of rendered states kept by __str__
+    CACHE_SIZE = 256
+
+    def __init__(self, layout=None):
+        """
+        :param layout: DEFAULT_KEYBOARD_LAYOUT of the keyboard handler, the
+                       letter rows are drawn from it instead of QWERTY
+        """
+        self._cache = OrderedDict()
+        self._upper_rows_cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    def __init__(self):
         self.highlight = {}
         self.shift = False
         self.caps_lock = False
@@ -64,6 +78,9 @@ class AsciiKeyboard:
             [self.LSHIFT_KEY, 'z', 'x', 'c', 'v', 'b', 'n', 'm', ',', '.', '/', self.RSHIFT_KEY],
             [self.CTRL_KEY, self.OPTION_KEY, self.CMD_KEY, self.SPACE_KEY, self.CMD_KEY, self.OPTION_KEY]
         ]
+        if layout is not None:
+            for row in range(3):
+                self._keys[row + 1][1:11] = list(layout['left'][row] + layout['right'][row])
         self._extended_keys = [
             [' '] + [' ' for i in range(1, 10)] + [' ', ' ', ' ', self.BACKSPACE_KEY],
             [self.TAB_KEY, ' ', '1', '2', '3', ' ', ' ', '0', '-', '=', ' ', ' ', ' ', self.RETURN_UPPER_KEY],
@@ -78,7 +95,8 @@ class AsciiKeyboard:
             '§': '±', '`': '~', '\\': '|',
         }
 
-    def __str__(self):
+    def _upper_rows(self, keys):
+        """Border rows between the key rows, they don't depend on the state"""
         result_rows = []
 
         def upper_part(row, prev_delim_indexes=None, first=False, last=False):
@@ -126,43 +144,78 @@ class AsciiKeyboard:
             # return our delim_indexes
             return delim_indexes
 
-        def lower_part(row):
-            result_row = ''
+        delim_indexes = set()
+        for i, row in enumerate(keys):
+            delim_indexes = upper_part(row, delim_indexes, first=i == 0)
 
-            # lower part of the keys row
-            for key in row:
-                if isinstance(key, SpecialKey):
-                    width = key.width
-                    text = key.text
-                else:
-                    width = 1
-                    if (self.shift and (key.isalpha() or key in self._shift)) or self.caps_lock and key.isalpha():
-                        if key in self._shift:
-                            text = self._shift[key]
-                        else:
-                            text = key.upper()
-                    else:
-                        text = key
+        delim_indexes = upper_part(row, delim_indexes, last=True)
+        return result_rows
 
-                if key in self.highlight:
-                    hl_left, hl_right = self.highlight[key]
-                    text = hl_left + text + hl_right
+    def _lower_row(self, row):
+        result_row = ''
+
+        # lower part of the keys row
+        for key in row:
+            if isinstance(key, SpecialKey):
+                width = key.width
+                text = key.text
+            else:
+                width = 1
+                if (self.shift and (key.isalpha() or key in self._shift)) or self.caps_lock and key.isalpha():
+                    if key in self._shift:
+                        text = self._shift[key]
+                    else:
+                        text = key.upper()
                 else:
-                    width += 2 * self.PADDING
+                    text = key
 
-                result_row += '|' + ('{:^%d}' % width).format(text)
-            result_row += '|'
-            result_rows.append(result_row)
-        
-        delim_indexes = set()
+            if key in self.highlight:
+                hl_left, hl_right = self.highlight[key]
+                text = hl_left + text + hl_right
+            else:
+                width += 2 * self.PADDING
+
+            result_row += '|' + ('{:^%d}' % width).format(text)
+        result_row += '|'
+        return result_row
+
+    def _render(self):
         keys = self._extended_keys if self.extended else self._keys
-        for i, row in enumerate(keys):
-            delim_indexes = upper_part(row, delim_indexes, first=i == 0)
-            lower_part(row)
+        upper_rows = self._upper_rows_cache.get(self.extended)
+        if upper_rows is None:
+            upper_rows = self._upper_rows_cache[self.extended] = self._upper_rows(keys)
 
-        delim_indexes = upper_part(row, delim_indexes, last=True)
+        result_rows = []
+        for upper_row, row in zip(upper_rows, keys):
+            result_rows.append(upper_row)
+            result_rows.append(self._lower_row(row))
+        result_rows.append(upper_rows[-1])
         return '\n'.join(result_rows)
 
+    @property
+    def state(self):
+        """Everything the rendered keyboard depends on"""
+        return self.shift, self.caps_lock, self.extended, frozenset(self.highlight.items())
+
+    @property
+    def cache_hit_rate(self):
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0
+
+    def __str__(self):
+        state = self.state
+        text = self._cache.get(state)
+        if text is not None:
+            self._cache.move_to_end(state)
+            self.cache_hits += 1
+            return text
+
+        self.cache_misses += 1
+        text = self._cache[state] = self._render()
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return text
+
 
 ASCII_DUALSHOCK = """\
              ,---,                                           ,---,
@@ -199,13 +252,18 @@ class AsciiDualShock:
         self.text = {}
 
     def _format(self, **kwargs):
-        format_kwargs = {**DEFAULT_FORMAT_KWARGS, **kwargs}
-        return ASCII_DUALSHOCK.format(**format_kwargs)
+        return _format_dualshock(frozenset(kwargs.items()))
 
     def __str__(self):
         return self._format(**self.text)
 
 
+@functools.lru_cache(maxsize=64)
+def _format_dualshock(text_items):
+    format_kwargs = {**DEFAULT_FORMAT_KWARGS, **dict(text_items)}
+    return ASCII_DUALSHOCK.format(**format_kwargs)
+
+
 if __name__ == '__main__':
     keyboard = AsciiKeyboard()
     keyboard.highlight['d'] = ('<', '>')
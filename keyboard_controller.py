@@ -5,12 +5,17 @@
 #
 # Distributed under terms of the MIT license.
 
+import math
 import platform
+import time
 import pygame
-import keyboard
 import numpy as np
 
-from controller import Controller as JoystickController
+from functools import partial
+
+from compiled_config import apply_config
+from controller import Controller as JoystickController, compile_button_actions
+from output import DirectOutput
 
 
 if platform.system() == 'Darwin':
@@ -38,11 +43,26 @@ class KeyboardControllerEventHandler(object):
     JOY_BUTTON_CTRL = 3
     JOY_BUTTON_ESC = 1
     JOY_ARROWS = {'type': 'hat', 'indexes': (1, 0)}
+    JOY_BUTTON_COMPLETE = 9
 
     LOOKUP = [
         [(1, 3), (0, 3), (1, 2), (0, 1), (1, 1), (2, 1), (1, 2), (2, 3)], # dist = 1
         [(1, 4), (0, 4), (0, 2), (0, 0), (1, 0), (2, 0), (2, 2), (2, 4)], # dist = 2
     ]
+    # number of cells per axis in the precomputed (x, y) -> (row, col) table
+    LOOKUP_RESOLUTION = 128
+    # L4 norm of the stick position above which the outer LOOKUP row is used
+    DIST_THR = 0.9
+    # [DIST_THR, LOOKUP_RESOLUTION, lookup_cells()] computed in advance, or None
+    precompiled_lookup = None
+    # commit the key as soon as the stick is returning to the center: when it is
+    # back within EARLY_COMMIT_RATIO of the gesture peak, moving towards the
+    # center at EARLY_COMMIT_SPEED or faster (axis range per second)
+    EARLY_COMMIT = False
+    EARLY_COMMIT_RATIO = 0.6
+    EARLY_COMMIT_SPEED = 5.0
+    # lower bound for the time between two axis events, events read in one batch arrive together
+    EARLY_COMMIT_MIN_DT = 0.001
     DEFAULT_KEYBOARD_LAYOUT = {
         "left": [
             "qwert",
@@ -68,10 +88,21 @@ class KeyboardControllerEventHandler(object):
         ]
     }
 
-    def __init__(self, axis_thr=None, config=None):
-        for attr in dir(config):
-            if hasattr(self, attr):
-                setattr(self, attr, getattr(config, attr))
+    def __init__(self, axis_thr=None, config=None, output=None, completer=None, snippets=None):
+        """
+        Initialize the event handler
+
+        :param output: output backend, see output.py, DirectOutput by default
+        :param completer: completion.WordCompleter fed with the keys sent,
+                          JOY_BUTTON_COMPLETE types its first completion
+        :param snippets: snippets.SnippetExpander fed with the keys sent
+        """
+
+        if output is None:
+            output = DirectOutput()
+        self.output = output
+
+        apply_config(self, config)
 
         if axis_thr is None:
             axis_thr = self.DEFAULT_AXIS_THR
@@ -107,23 +138,38 @@ class KeyboardControllerEventHandler(object):
             "right": "",
         }
         self.current_arrows = set()
+        # keys pressed by buttons and the hat, not released yet
+        self._held = set()
         self.on_state_changed = None
+        self.completer = completer
+        self.snippets = snippets
+
+        # time source of the early commit speed, replays can substitute their own
+        self.clock = time.perf_counter
+        # (magnitude, time) of the previous axis event of each stick
+        self._motion = {
+            "left": (0, 0),
+            "right": (0, 0),
+        }
+        # sticks whose key was committed early and which didn't return to the center yet
+        self._committed = {
+            "left": False,
+            "right": False,
+        }
+
+        self._compile_lookup()
+        self.compile_buttons()
 
     @staticmethod
     def _get_angle(x, y):
-        v0 = np.array([1, 0])
-        v = np.array([x, y])
-        dot = np.dot(v, v0)
-        det = np.linalg.det([v, v0])
-        angle = np.arctan2(det, dot)
-        # round to nearest k * np.pi / 4
-        return int(round(angle * 4 / np.pi))
+        # angle from (1, 0), the y axis points down, 0.0 - y keeps the angle of (-x, 0) at pi
+        angle = math.atan2(0.0 - y, x)
+        # round to nearest k * pi / 4
+        return int(round(angle * 4 / math.pi))
 
-    @staticmethod
-    def _get_dist(x, y):
-        v = np.array([x, y])
-        return 2 if np.linalg.norm(v, ord=4) > 0.9 else 1
-        return 2 if np.all(np.abs(v) > 0.6) else 1
+    def _get_dist(self, x, y):
+        # L4 norm
+        return 2 if (x ** 4 + y ** 4) ** 0.25 > self.DIST_THR else 1
 
     @property
     def keyboard_layout(self):
@@ -132,7 +178,62 @@ class KeyboardControllerEventHandler(object):
         else:
             return self.DEFAULT_KEYBOARD_LAYOUT
 
-    def _get_key(self, left_right, x, y):
+    def lookup_cells(self):
+        """
+        LOOKUP entries of the quantized (x, y) cells, see _compile_lookup
+
+        :return: string with a character per cell, chr(ord('a') + 8 * (dist - 1) + angle)
+                 or ' ' if the cell is not entirely within one entry
+        """
+        n = self.LOOKUP_RESOLUTION
+        edges = np.linspace(-1, 1, n + 1)
+        # angles as in _get_angle, the y axis points down
+        sector = np.rint(np.arctan2(-edges[None, :], edges[:, None]) * 4 / np.pi).astype(int) % 8
+        norm = (np.abs(edges[:, None]) ** 4 + np.abs(edges[None, :]) ** 4) ** 0.25
+
+        # sectors are convex cones, so a cell whose 4 corners share a sector lies inside it
+        corners = (sector[:-1, :-1], sector[1:, :-1], sector[:-1, 1:], sector[1:, 1:])
+        same_sector = np.all([c == corners[0] for c in corners[1:]], axis=0)
+
+        # norm is convex: max over the cell is at a corner and min is at the
+        # point of the cell closest to the origin
+        corner_norm = (norm[:-1, :-1], norm[1:, :-1], norm[:-1, 1:], norm[1:, 1:])
+        inner = np.max(corner_norm, axis=0) <= self.DIST_THR
+        closest = np.where(edges[:-1] * edges[1:] <= 0, 0, np.minimum(np.abs(edges[:-1]), np.abs(edges[1:])))
+        outer = (closest[:, None] ** 4 + closest[None, :] ** 4) ** 0.25 > self.DIST_THR
+
+        codes = np.where(same_sector & (inner | outer), ord('a') + 8 * outer + corners[0], ord(' '))
+        return codes.astype(np.uint8).tobytes().decode('ascii')
+
+    def _compile_lookup(self):
+        """
+        Precompute quantized (x, y) -> key tables for both layouts.
+
+        The [-1, 1] x [-1, 1] square is split into LOOKUP_RESOLUTION^2 cells.
+        A cell gets a key only if every point inside it resolves to the same
+        LOOKUP entry, otherwise it is None and _get_key falls back to the
+        exact computation, so the result is always the same as _get_key_exact.
+
+        The cells are taken from precompiled_lookup, as saved by
+        compiled_config.py, if it was computed with the same settings.
+        """
+        precompiled = self.precompiled_lookup
+        if precompiled is not None and precompiled[:2] == [self.DIST_THR, self.LOOKUP_RESOLUTION]:
+            cells = precompiled[2]
+        else:
+            cells = self.lookup_cells()
+
+        self._lookup_scale = self.LOOKUP_RESOLUTION / 2
+        self._lookup_tables = {}
+        for extended, layout in ((False, self.DEFAULT_KEYBOARD_LAYOUT), (True, self.EXTENDED_KEYBOARD_LAYOUT)):
+            self._lookup_tables[extended] = {}
+            for left_right, data in layout.items():
+                keys = {chr(ord('a') + 8 * dist + angle): data[row][col]
+                        for dist, entries in enumerate(self.LOOKUP) for angle, (row, col) in enumerate(entries)}
+                keys[' '] = None
+                self._lookup_tables[extended][left_right] = list(map(keys.__getitem__, cells))
+
+    def _get_key_exact(self, left_right, x, y):
         angle = self._get_angle(x, y)
         dist = self._get_dist(x, y)
 
@@ -140,130 +241,206 @@ class KeyboardControllerEventHandler(object):
         data = self.keyboard_layout[left_right]
         return data[row][col]
 
-    def _button_down_event(self, event):
-        if event.button == self.JOY_BUTTON_SPACE:
-            keyboard.press('space')
-
-        elif event.button == self.JOY_BUTTON_BACKSPACE:
-            keyboard.press('backspace')
-
-        elif (self.JOY_SHIFT.get('type') == 'button' and
-                event.button == self.JOY_SHIFT['value']):
-            self.shift = True
-            keyboard.press('shift')
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif (self.JOY_EXTENDED.get('type') == 'button' and
-                event.button == self.JOY_EXTENDED['value']):
-            self.extended = True
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif event.button == self.JOY_BUTTON_TAB:
-            keyboard.press('tab')
-
-        elif event.button == self.JOY_BUTTON_RETURN:
-            keyboard.press('return')
-
-        elif event.button == self.JOY_BUTTON_CAPS_LOCK:
-            self.caps_lock = not self.caps_lock
-            keyboard.press('caps lock')
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif event.button == self.JOY_BUTTON_CMD:
-            keyboard.press('command')
-
-        elif event.button == self.JOY_BUTTON_OPTION:
-            keyboard.press(OPTION)
-
-        elif event.button == self.JOY_BUTTON_CTRL:
-            keyboard.press(CONTROL)
+    def _get_key(self, left_right, x, y):
+        if -1 <= x <= 1 and -1 <= y <= 1:
+            n = self.LOOKUP_RESOLUTION
+            i = int((x + 1) * self._lookup_scale)
+            j = int((y + 1) * self._lookup_scale)
+            if i < n and j < n:
+                key = self._lookup_tables[self.extended][left_right][i * n + j]
+                if key is not None:
+                    return key
+        return self._get_key_exact(left_right, x, y)
+
+    def get_keys(self, left_right, x, y, extended=False, dist_thr=None):
+        """
+        Vectorized _get_key_exact for arrays of stick positions
+
+        :param x, y: arrays of axis values
+        :param extended: use EXTENDED_KEYBOARD_LAYOUT
+        :param dist_thr: DIST_THR to use instead of the configured one
+        :return: array of keys with the shape of x
+        """
+        if dist_thr is None:
+            dist_thr = self.DIST_THR
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        layout = (self.EXTENDED_KEYBOARD_LAYOUT if extended else self.DEFAULT_KEYBOARD_LAYOUT)[left_right]
+        keys = np.array([[layout[row][col] for row, col in cells] for cells in self.LOOKUP])
+
+        # same rounding as _get_angle, np.rint and round() both round half to even
+        angle = np.rint(np.arctan2(-y, x) * 4 / np.pi).astype(np.intp) % 8
+        outer = (np.abs(x) ** 4 + np.abs(y) ** 4) ** 0.25 > dist_thr
+        return keys[outer.astype(np.intp), angle]
+
+    def classify_stream(self, left_right, x, y, extended=False, dist_thr=None, axis_thr=None):
+        """
+        Keys committed by _axis_move_event for a stream of stick positions
+
+        Sample i is the stick position after the i-th axis event of the
+        stick. Like the handler without EARLY_COMMIT, values within axis_thr
+        count as 0, a key is committed whenever both axes are 0, and it is
+        picked by the largest magnitude each axis reached since the previous
+        commit.
+
+        :param x, y: 1-d arrays of axis values
+        :param axis_thr: deadzone to use instead of the handler's one
+        :return: (indexes of the committing samples, committed keys)
+        """
+        if axis_thr is None:
+            axis_thr = self.axis_thr
+        x = np.where(np.abs(x) > axis_thr, x, 0).astype(float)
+        y = np.where(np.abs(y) > axis_thr, y, 0).astype(float)
+        commits = np.flatnonzero((x == 0) & (y == 0))
+        if not len(commits):
+            return commits, np.array([], dtype=str)
+
+        # samples after the last commit don't belong to any gesture
+        end = commits[-1] + 1
+        starts = np.concatenate(([0], commits[:-1] + 1))
+        segment = np.repeat(np.arange(len(commits)), np.diff(np.concatenate(([0], commits + 1))))
+
+        peaks = []
+        for values in (x[:end], y[:end]):
+            magnitude = np.abs(values)
+            peak = np.maximum.reduceat(magnitude, starts)
+            # the first sample reaching the peak wins, later ones only replace it if larger
+            at_peak = np.flatnonzero(magnitude == peak[segment])
+            _, first = np.unique(segment[at_peak], return_index=True)
+            peaks.append(values[at_peak[first]])
+        return commits, self.get_keys(left_right, peaks[0], peaks[1], extended, dist_thr)
+
+    def _notify_state_changed(self):
+        if self.on_state_changed is not None:
+            self.on_state_changed(self)
+
+    def _shift_down(self):
+        self.shift = True
+        self.output.press('shift')
+        self._notify_state_changed()
+
+    def _shift_up(self):
+        self.shift = False
+        self.output.release('shift')
+        self._notify_state_changed()
 
-        elif event.button == self.JOY_BUTTON_ESC:
-            keyboard.press('esc')
+    def _extended_down(self):
+        self.extended = True
+        self._notify_state_changed()
 
-        elif self.JOY_ARROWS.get('type') == 'buttons':
-            up = self.JOY_ARROWS['UP']
-            down = self.JOY_ARROWS['DOWN']
-            left = self.JOY_ARROWS['LEFT']
-            right = self.JOY_ARROWS['RIGHT']
+    def _extended_up(self):
+        self.extended = False
+        self._notify_state_changed()
+
+    def _caps_lock_down(self):
+        self.caps_lock = not self.caps_lock
+        self.output.press('caps lock')
+        self._held.add('caps lock')
+        self._notify_state_changed()
+
+    def _caps_lock_up(self):
+        self.output.release('caps lock')
+        self._held.discard('caps lock')
+        self._notify_state_changed()
+
+    def compile_buttons(self):
+        """Build the button dispatch table, call again after changing JOY_* attributes or the completer"""
+        def key(button, name):
+            return button, partial(self._key_down, name), partial(self._key_up, name)
+
+        def button_of(joy_setting):
+            return joy_setting['value'] if joy_setting.get('type') == 'button' else None
+
+        actions = [
+            key(self.JOY_BUTTON_SPACE, 'space'),
+            key(self.JOY_BUTTON_BACKSPACE, 'backspace'),
+            (button_of(self.JOY_SHIFT), self._shift_down, self._shift_up),
+            (button_of(self.JOY_EXTENDED), self._extended_down, self._extended_up),
+            key(self.JOY_BUTTON_TAB, 'tab'),
+            key(self.JOY_BUTTON_RETURN, 'return'),
+            (self.JOY_BUTTON_CAPS_LOCK, self._caps_lock_down, self._caps_lock_up),
+            key(self.JOY_BUTTON_CMD, 'command'),
+            key(self.JOY_BUTTON_OPTION, OPTION),
+            key(self.JOY_BUTTON_CTRL, CONTROL),
+            key(self.JOY_BUTTON_ESC, 'esc'),
+        ]
+        if self.JOY_ARROWS.get('type') == 'buttons':
+            actions += [
+                key(self.JOY_ARROWS['UP'], 'up'),
+                key(self.JOY_ARROWS['DOWN'], 'down'),
+                key(self.JOY_ARROWS['LEFT'], 'left'),
+                key(self.JOY_ARROWS['RIGHT'], 'right'),
+            ]
+        if self.completer is not None:
+            # last, the button is only taken if nothing else uses it
+            actions.append((self.JOY_BUTTON_COMPLETE, self._accept_completion, lambda: None))
+        self._button_actions = compile_button_actions(*actions)
+
+    def _key_down(self, name):
+        self.output.press(name)
+        self._held.add(name)
+        self._key_sent(name)
+        if self.completer is not None:
+            # the completions changed
+            self._notify_state_changed()
+
+    def _key_up(self, name):
+        self.output.release(name)
+        self._held.discard(name)
+
+    def release_all(self):
+        """
+        Release the keys held and drop the gestures in progress without
+        committing them, e.g. when the gamepad is disconnected
+        """
+        for name in self._held:
+            self.output.release(name)
+        self._held.clear()
+        self.current_arrows.clear()
+        if self.shift:
+            self._shift_up()
+        if self.extended:
+            self._extended_up()
+        for left_right in self.axis:
+            # a stick in the middle of a gesture is ignored until it is centered again
+            self._committed[left_right] = any(self.axis[left_right]) or any(self.last[left_right])
+            self.axis[left_right] = [0, 0]
+            self.last[left_right] = [0, 0]
+            self.current_key[left_right] = ""
+            self._motion[left_right] = (0, 0)
+        self._notify_state_changed()
+
+    def _key_sent(self, key):
+        """Follow the text being typed"""
+        if self.snippets is not None:
+            expansion = self.snippets.feed(key, self.shift)
+            if expansion is not None:
+                erase, text = expansion
+                self.output.write(text, erase)
+                if self.completer is not None:
+                    self.completer.reset()
+                return
+        if self.completer is not None:
+            self.completer.feed(key, self.shift)
+
+    def _accept_completion(self):
+        if self.completer is not None:
+            text = self.completer.accept()
+            if text:
+                self.output.write(text)
+                if self.snippets is not None:
+                    self.snippets.reset()
+                self._notify_state_changed()
 
-            if event.button in (up, down, left, right):
-                if event.button == up:
-                    keyboard.press('up')
-                elif event.button == down:
-                    keyboard.press('down')
-                elif event.button == left:
-                    keyboard.press('left')
-                elif event.button == right:
-                    keyboard.press('right')
+    def _button_down_event(self, event):
+        actions = self._button_actions.get(event.button)
+        if actions is not None:
+            actions[0]()
 
     def _button_up_event(self, event):
-        if event.button == self.JOY_BUTTON_SPACE:
-            keyboard.release('space')
-
-        if event.button == self.JOY_BUTTON_BACKSPACE:
-            keyboard.release('backspace')
-
-        elif (self.JOY_SHIFT.get('type') == 'button' and
-                event.button == self.JOY_SHIFT['value']):
-            self.shift = False
-            keyboard.release('shift')
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif (self.JOY_EXTENDED.get('type') == 'button' and
-                event.button == self.JOY_EXTENDED['value']):
-            self.extended = False
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif event.button == self.JOY_BUTTON_TAB:
-            keyboard.release('tab')
-
-        elif event.button == self.JOY_BUTTON_RETURN:
-            keyboard.release('return')
-
-        elif event.button == self.JOY_BUTTON_CAPS_LOCK:
-            keyboard.release('caps lock')
-
-            if self.on_state_changed is not None:
-                self.on_state_changed(self)
-
-        elif event.button == self.JOY_BUTTON_CMD:
-            keyboard.release('command')
-
-        elif event.button == self.JOY_BUTTON_OPTION:
-            keyboard.release(OPTION)
-
-        elif event.button == self.JOY_BUTTON_CTRL:
-            keyboard.release(CONTROL)
-
-        elif event.button == self.JOY_BUTTON_ESC:
-            keyboard.release('esc')
-
-        elif self.JOY_ARROWS.get('type') == 'buttons':
-            up = self.JOY_ARROWS['UP']
-            down = self.JOY_ARROWS['DOWN']
-            left = self.JOY_ARROWS['LEFT']
-            right = self.JOY_ARROWS['RIGHT']
-
-            if event.button in (up, down, left, right):
-                if event.button == up:
-                    keyboard.release('up')
-                elif event.button == down:
-                    keyboard.release('down')
-                elif event.button == left:
-                    keyboard.release('left')
-                elif event.button == right:
-                    keyboard.release('right')
+        actions = self._button_actions.get(event.button)
+        if actions is not None:
+            actions[1]()
 
     def _axis_move_event(self, event):
         if event.axis in self.JOY_AXIS_TO_LR:
@@ -272,64 +449,79 @@ class KeyboardControllerEventHandler(object):
             self.axis[left_right][self.JOY_AXIS_TO_INTERNAL[event.axis]] = (
                 event.value if abs(event.value) > self.axis_thr else 0
             )
-
-            for index in self.LR_TO_JOY_AXIS[left_right]:
-                iindex = self.JOY_AXIS_TO_INTERNAL[index]
-                value = self.axis[left_right][iindex]
-                if abs(value) > abs(self.last[left_right][iindex]):
-                    self.last[left_right][iindex] = value
-
-            x, y = self.last[left_right]
-            key = self._get_key(left_right, x, y)
-            if self.current_key[left_right] != key:
-                self.current_key[left_right] = key
-                if self.on_state_changed:
-                    self.on_state_changed(self)
-
-            if all((abs(i) == 0 for i in self.axis[left_right])):
-                if key.isalpha() and self.caps_lock:
-                    key = "shift+" + key
-                # comma is the separator for multiple keystrokes in the keyboard library
-                if key == "shift+,":
-                    key = "shift+<"
-                keyboard.send(key)
-                # os.system('clear')
-                # print(key)
-                # print(self.last[left_right])
-                self.last[left_right] = [0, 0]
-                self.current_key[left_right] = ""
-                if self.on_state_changed:
-                    self.on_state_changed(self)
+            centered = all((abs(i) == 0 for i in self.axis[left_right]))
+            if centered:
+                # the next gesture starts from the center
+                self._motion[left_right] = (0, 0)
+
+            if self._committed[left_right]:
+                # the key of this gesture is already sent, wait for the stick to center
+                if centered:
+                    self._committed[left_right] = False
+            else:
+                for index in self.LR_TO_JOY_AXIS[left_right]:
+                    iindex = self.JOY_AXIS_TO_INTERNAL[index]
+                    value = self.axis[left_right][iindex]
+                    if abs(value) > abs(self.last[left_right][iindex]):
+                        self.last[left_right][iindex] = value
+
+                x, y = self.last[left_right]
+                key = self._get_key(left_right, x, y)
+                if self.current_key[left_right] != key:
+                    self.current_key[left_right] = key
+                    if self.on_state_changed:
+                        self.on_state_changed(self)
+
+                if centered:
+                    self._commit_key(left_right, key)
+                elif self.EARLY_COMMIT and self._is_returning(left_right):
+                    self._commit_key(left_right, key)
+                    self._committed[left_right] = True
 
         elif (self.JOY_SHIFT.get('type') == 'axis' and
                 event.axis == self.JOY_SHIFT['value']):
             if not self.shift and event.value > -0.85:
-                self.shift = True
-                keyboard.press('shift')
-
-                if self.on_state_changed is not None:
-                    self.on_state_changed(self)
+                self._shift_down()
 
             elif self.shift and event.value < -0.95:
-                self.shift = False
-                keyboard.release('shift')
-
-                if self.on_state_changed is not None:
-                    self.on_state_changed(self)
+                self._shift_up()
 
         elif (self.JOY_EXTENDED.get('type') == 'axis' and
                 event.axis == self.JOY_EXTENDED['value']):
             if not self.extended and event.value > -0.85:
-                self.extended = True
-
-                if self.on_state_changed is not None:
-                    self.on_state_changed(self)
+                self._extended_down()
 
             elif self.extended and event.value < -0.95:
-                self.extended = False
-
-                if self.on_state_changed is not None:
-                    self.on_state_changed(self)
+                self._extended_up()
+
+    def _is_returning(self, left_right):
+        """Whether the stick is moving back to the center fast, see EARLY_COMMIT"""
+        now = self.clock()
+        magnitude = max(abs(i) for i in self.axis[left_right])
+        previous, previous_time = self._motion[left_right]
+        self._motion[left_right] = (magnitude, now)
+
+        peak = max(abs(i) for i in self.last[left_right])
+        if magnitude > peak * self.EARLY_COMMIT_RATIO:
+            return False
+        speed = (previous - magnitude) / max(now - previous_time, self.EARLY_COMMIT_MIN_DT)
+        return speed >= self.EARLY_COMMIT_SPEED
+
+    def _commit_key(self, left_right, key):
+        if key.isalpha() and self.caps_lock:
+            key = "shift+" + key
+        # comma is the separator for multiple keystrokes in the keyboard library
+        if key == "shift+,":
+            key = "shift+<"
+        self.output.send(key)
+        self._key_sent(key)
+        # os.system('clear')
+        # print(key)
+        # print(self.last[left_right])
+        self.last[left_right] = [0, 0]
+        self.current_key[left_right] = ""
+        if self.on_state_changed:
+            self.on_state_changed(self)
 
     def _hat_move_event(self, event):
         if not self.JOY_ARROWS.get('type') == 'hat': return
@@ -344,16 +536,16 @@ class KeyboardControllerEventHandler(object):
                 lt0, gt0 = directions
                 if event.value[indexes[i]] < 0:
                     self.current_arrows.add(lt0)
-                    keyboard.press(lt0)
+                    self._key_down(lt0)
                 elif event.value[indexes[i]] > 0:
                     self.current_arrows.add(gt0)
-                    keyboard.press(gt0)
+                    self._key_down(gt0)
                 # else if 0 and self.current_arrows has our values
                 elif self.current_arrows.intersection({lt0, gt0}):
                     if lt0 in self.current_arrows:
-                        keyboard.release(lt0)
+                        self._key_up(lt0)
                     if gt0 in self.current_arrows:
-                        keyboard.release(gt0)
+                        self._key_up(gt0)
                     self.current_arrows.difference_update({lt0, gt0})
 
     @property
@@ -368,9 +560,4 @@ class KeyboardControllerEventHandler(object):
 if __name__ == "__main__":
     k = KeyboardControllerEventHandler()
     c = JoystickController(k.handlers_dict, init_controller=True)
-
-    clock = pygame.time.Clock()
-    while True:
-        for event in pygame.event.get():
-            c.process_event(event)
-        clock.tick(60)
+    c.listen()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# End-to-end input latency instrumentation.
+#
+# Every event gets its arrival time when it is taken from the pygame queue
+# (tracker.begin()), later stages record the time elapsed since then:
+#
+#   dispatch   Controller.process_event
+#   routing    SwitchControllerEventHandler picked the mode handlers
+#   decision   handler requested keyboard / mouse output
+#   injection  keyboard / mouse call returned
+#
+# render is the duration of the terminal overlay redraw.
+
+import functools
+import math
+import threading
+import time
+
+
+STAGES = ('dispatch', 'routing', 'decision', 'injection', 'render')
+
+
+class Histogram:
+    """Log-scale histogram of durations, 4 buckets per power of 2 microseconds"""
+
+    BUCKETS_PER_OCTAVE = 4
+    # up to 2^24 us ~ 16 s
+    OCTAVES = 24
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS_PER_OCTAVE * self.OCTAVES + 1)
+        self.count = 0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        i = int(math.log2(us) * self.BUCKETS_PER_OCTAVE) + 1 if us >= 1 else 0
+        self.counts[min(i, len(self.counts) - 1)] += 1
+        self.count += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in seconds"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        total = 0
+        for i, count in enumerate(self.counts):
+            total += count
+            if total >= rank:
+                return 2 ** (i / self.BUCKETS_PER_OCTAVE) / 1e6
+        return None
+
+
+class LatencyTracker:
+    """Per-stage latency histograms, see the module description"""
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        # arrival time of the event being processed, per thread
+        self._local = threading.local()
+
+    @property
+    def start(self):
+        return getattr(self._local, 'start', None)
+
+    def begin(self, t=None):
+        """Mark the arrival of the event the current thread is about to process"""
+        self._local.start = time.perf_counter() if t is None else t
+
+    def stamp(self, stage):
+        """Record the time since the arrival of the current event"""
+        start = self.start
+        if start is not None:
+            self.histograms[stage].add(time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        self.histograms[stage].add(seconds)
+
+    def reset(self):
+        self.histograms = {stage: Histogram() for stage in STAGES}
+
+    def report(self):
+        lines = ['{:<12}{:>10}{:>10}{:>10}{:>10}'.format('stage, us', 'count', 'p50', 'p95', 'p99')]
+        for stage in STAGES:
+            histogram = self.histograms[stage]
+            percentiles = [histogram.percentile(p) for p in (50, 95, 99)]
+            lines.append('{:<12}{:>10}'.format(stage, histogram.count) + ''.join(
+                '{:>10}'.format('-' if p is None else '{:.0f}'.format(p * 1e6)) for p in percentiles
+            ))
+        return '\n'.join(lines)
+
+
+tracker = LatencyTracker()
+
+
+def instrumented(method):
+    """Record decision and injection stages around an output method"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if not tracker.enabled:
+            return method(*args, **kwargs)
+        tracker.stamp('decision')
+        result = method(*args, **kwargs)
+        tracker.stamp('injection')
+        return result
+    return wrapper
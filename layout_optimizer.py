@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Search for a DEFAULT_KEYBOARD_LAYOUT typing a text corpus faster.
+#
+# Cost model, in seconds per character of the corpus:
+#
+#   every layout character costs the time of the fastest gesture reaching
+#   its key, gestures to the outer ring and diagonal ones take longer
+#
+#   when the next character is on the other stick, its gesture starts while
+#   the previous stick is still returning to the center, which saves
+#   ALTERNATION_OVERLAP
+#
+#   spaces and newlines are buttons and cost BUTTON_TIME, other characters
+#   are not counted
+#
+# Layouts are searched with simulated annealing of key swaps, independent
+# chains run in parallel in a process pool and the best layout wins.
+
+import argparse
+import math
+import os
+import random
+import time
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from keyboard_controller import KeyboardControllerEventHandler
+
+
+# gesture time by (outer ring, diagonal)
+GESTURE_TIME = {
+    (False, False): 0.20,
+    (False, True): 0.22,
+    (True, False): 0.26,
+    (True, True): 0.30,
+}
+ALTERNATION_OVERLAP = 0.08
+BUTTON_TIME = 0.15
+BUTTON_CHARACTERS = ' \n'
+
+STICKS = ('left', 'right')
+ROWS = 3
+COLUMNS = 5
+
+
+def slot_times(lookup=KeyboardControllerEventHandler.LOOKUP):
+    """Gesture time of every (stick, row, column) slot, flattened"""
+    times = np.full(ROWS * COLUMNS, np.inf)
+    for dist, cells in enumerate(lookup):
+        for angle, (row, col) in enumerate(cells):
+            t = GESTURE_TIME[dist == 1, angle % 2 == 1]
+            times[row * COLUMNS + col] = min(times[row * COLUMNS + col], t)
+    return np.concatenate([times] * len(STICKS))
+
+
+class CostModel:
+    """
+    Corpus statistics and the cost model of the module description
+
+    :param text: corpus
+    :param characters: the characters to place, those of DEFAULT_KEYBOARD_LAYOUT by default
+    """
+
+    def __init__(self, text, characters=None):
+        if characters is None:
+            layout = KeyboardControllerEventHandler.DEFAULT_KEYBOARD_LAYOUT
+            characters = ''.join(''.join(layout[stick]) for stick in STICKS)
+        self.characters = characters
+        index = {c: i for i, c in enumerate(characters)}
+
+        text = text.lower()
+        self.unigrams = np.zeros(len(characters))
+        self.bigrams = np.zeros((len(characters), len(characters)))
+        counts = Counter(text)
+        for c, count in counts.items():
+            if c in index:
+                self.unigrams[index[c]] = count
+        for (a, b), count in Counter(zip(text, text[1:])).items():
+            if a in index and b in index:
+                self.bigrams[index[a], index[b]] += count
+        # order doesn't matter for alternation
+        self.pairs = self.bigrams + self.bigrams.T
+        np.fill_diagonal(self.pairs, 0)
+
+        self.buttons = sum(counts[c] for c in BUTTON_CHARACTERS)
+        self.typed = self.unigrams.sum() + self.buttons
+        self.times = slot_times()
+
+    def cost(self, slots):
+        """Total seconds to type the corpus, slots[i] is the slot of characters[i]"""
+        stick = slots // (ROWS * COLUMNS)
+        alternating = stick[:, None] != stick[None, :]
+        return (self.unigrams @ self.times[slots] - ALTERNATION_OVERLAP * (self.bigrams * alternating).sum() +
+                BUTTON_TIME * self.buttons)
+
+    def swap_delta(self, slots, stick, i, j):
+        """Cost change of swapping the slots of characters i and j"""
+        delta = (self.unigrams[i] - self.unigrams[j]) * (self.times[slots[j]] - self.times[slots[i]])
+        if stick[i] != stick[j]:
+            # i and j change sticks, pairs with every other character flip between same and alternating
+            for a in (i, j):
+                same = np.where(stick == stick[a], 1.0, -1.0)
+                same[i] = same[j] = 0
+                delta -= ALTERNATION_OVERLAP * (self.pairs[a] @ same)
+        return delta
+
+    def wpm(self, slots):
+        """Words (5 typed characters) per minute"""
+        return self.typed / 5 / (self.cost(slots) / 60)
+
+    def layout(self, slots):
+        """Layout dict in the format of DEFAULT_KEYBOARD_LAYOUT"""
+        grid = [' '] * len(slots)
+        for c, slot in zip(self.characters, slots):
+            grid[slot] = c
+        size = ROWS * COLUMNS
+        return {
+            stick: [''.join(grid[s * size + r * COLUMNS:s * size + (r + 1) * COLUMNS]) for r in range(ROWS)]
+            for s, stick in enumerate(STICKS)
+        }
+
+    def slots(self, layout):
+        """Inverse of layout()"""
+        grid = ''.join(''.join(layout[stick]) for stick in STICKS)
+        return np.array([grid.index(c) for c in self.characters])
+
+
+def anneal(model, slots, iterations, seed, start_temperature=None, end_temperature=None):
+    """
+    Simulated annealing of swaps, temperatures are in seconds per typed character
+
+    :return: (cost, slots) of the best layout seen
+    """
+    rnd = random.Random(seed)
+    scale = model.typed
+    if start_temperature is None:
+        start_temperature = 0.01
+    if end_temperature is None:
+        end_temperature = 1e-5
+    cooling = (end_temperature / start_temperature) ** (1 / iterations)
+
+    slots = np.array(slots)
+    stick = slots // (ROWS * COLUMNS)
+    cost = model.cost(slots)
+    best_cost, best_slots = cost, slots.copy()
+    temperature = start_temperature * scale
+    n = len(slots)
+    for _ in range(iterations):
+        i = rnd.randrange(n)
+        j = rnd.randrange(n - 1)
+        j += j >= i
+        delta = model.swap_delta(slots, stick, i, j)
+        if delta < 0 or rnd.random() < math.exp(-delta / temperature):
+            slots[i], slots[j] = slots[j], slots[i]
+            stick[i], stick[j] = stick[j], stick[i]
+            cost += delta
+            if cost < best_cost:
+                best_cost, best_slots = cost, slots.copy()
+        temperature *= cooling
+    # recompute to get rid of the accumulated rounding errors
+    return model.cost(best_slots), best_slots
+
+
+def _anneal_chain(args):
+    model, iterations, seed = args
+    slots = np.random.default_rng(seed).permutation(len(model.characters))
+    return anneal(model, slots, iterations, seed)
+
+
+def optimize(model, chains=None, iterations=200000, workers=None, seed=0):
+    """
+    Run independent annealing chains from random layouts in a process pool
+
+    :param chains: number of chains, one per worker by default
+    :param workers: number of processes, os.cpu_count() by default
+    :return: (cost, slots) of the best layout found
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chains is None:
+        chains = workers
+    tasks = [(model, iterations, seed + chain) for chain in range(chains)]
+    if workers == 1:
+        results = map(_anneal_chain, tasks)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_anneal_chain, tasks))
+    return min(results, key=lambda result: result[0])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search for a faster DEFAULT_KEYBOARD_LAYOUT for a text corpus')
+    parser.add_argument('corpus', nargs='+', help='text files')
+    parser.add_argument('--chains', type=int, help='annealing chains, one per worker by default')
+    parser.add_argument('--iterations', type=int, default=200000, help='swaps tried per chain')
+    parser.add_argument('--workers', type=int, help='worker processes, the number of CPUs by default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    text = []
+    for path in args.corpus:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            text.append(f.read())
+    model = CostModel('\n'.join(text))
+    baseline = model.slots(KeyboardControllerEventHandler.DEFAULT_KEYBOARD_LAYOUT)
+
+    start = time.perf_counter()
+    cost, slots = optimize(model, args.chains, args.iterations, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+
+    print('# {:,.0f} characters, searched in {:.1f}s'.format(model.typed, elapsed))
+    print('# estimated speed: {:.1f} wpm, {:.1f} wpm with the default layout ({:+.1%})'.format(
+        model.wpm(slots), model.wpm(baseline), model.wpm(slots) / model.wpm(baseline) - 1
+    ))
+    print('DEFAULT_KEYBOARD_LAYOUT = {!r}'.format(model.layout(slots)))
@@ -5,18 +5,43 @@
 #
 # Distributed under terms of the MIT license.
 
+import sys
+
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    # installed before the other imports to time them
+    from startup_profile import StartupProfiler
+    startup_profiler = StartupProfiler()
+    startup_profiler.install()
+else:
+    startup_profiler = None
+
+import argparse
 import platform
+import signal
+import threading
+import time
 import pygame
 
 from collections import OrderedDict
 
+# modules only needed in keyboard mode or by options are imported where they are used
 from controller import Controller as JoystickController
-from mouse_controller import MouseControllerEventHandler
+from mouse_controller import MouseControllerEventHandler, MouseIntegrator
 from keyboard_controller import KeyboardControllerEventHandler
 from switch_controller import SwitchControllerEventHandler
+from output import DirectOutput, QueuedOutput
+from latency import tracker as latency
 from help import AsciiKeyboard, AsciiDualShock
+from renderer import TerminalRenderer
+from compiled_config import load as load_config, profile
+
+if startup_profiler is not None:
+    startup_profiler.mark('imports')
+
+config = load_config()
 
-import config
+if startup_profiler is not None:
+    startup_profiler.mark('config')
 
 
 class JoyButtonSwitchEventHandler:
@@ -47,7 +72,11 @@ class JoyButtonSwitchEventHandler:
         return self.values[self.switch_counter]
 
 
-def create_ascii_dualshock(mode="mouse"):
+def create_ascii_dualshock(mode="mouse", layout=None):
+    """
+    :param layout: DEFAULT_KEYBOARD_LAYOUT of the keyboard handler, the stick labels
+                   of the keyboard mode are its rows
+    """
     tu = '  Mouse   '
     td = ' Keyboard '
     if mode == "mouse":
@@ -62,12 +91,10 @@ def create_ascii_dualshock(mode="mouse"):
         r1 = 'RMB'
     else:
         td = '[' + td + ']'
-        lau = 'qwert'
-        lam = 'asdfg'
-        lad = 'zxcvb'
-        rau = 'yuiop'
-        ram = 'hjkl;'
-        rad = 'nm,./'
+        if layout is None:
+            layout = KeyboardControllerEventHandler.DEFAULT_KEYBOARD_LAYOUT
+        lau, lam, lad = (''.join(row) for row in layout["left"])
+        rau, ram, rad = (''.join(row) for row in layout["right"])
         r2u = '1'
         r2d = ']'
         l1 = 'Space'
@@ -97,72 +124,369 @@ def create_ascii_dualshock(mode="mouse"):
     return ds4
 
 
-def main():
-    mouse = MouseControllerEventHandler(config=config)
-    keyboard = KeyboardControllerEventHandler(config=config)
+class DeviceView:
+    """Overlay of a gamepad: the DualShock in its mode and its keyboard"""
 
-    switch_handler = JoyButtonSwitchEventHandler(["mouse", "keyboard"],
-        button=getattr(config, "JOY_BUTTON_SWITCH", 13),
-        on_switch=lambda mode: print('\033[23F', create_ascii_dualshock(mode), sep='\n')
-    )
-    switch_controller = SwitchControllerEventHandler(switch_handler, {
-        "mouse": mouse.handlers_dict,
-        "keyboard": keyboard.handlers_dict
-    }, "mouse", OrderedDict([
-        ("mouse", {
-            pygame.JOYBUTTONDOWN: mouse.buttons_used,
-            pygame.JOYBUTTONUP: mouse.buttons_used,
-            pygame.JOYAXISMOTION: mouse.axes_used
-        }),
-        ("keyboard", {
-            pygame.JOYAXISMOTION: tuple(range(6)),
-            pygame.JOYBUTTONDOWN: tuple(range(16)),
-            pygame.JOYBUTTONUP: tuple(range(16)),
-            pygame.JOYHATMOTION: (0, ),
-        })
-    ]))
-
-    joystick = JoystickController(switch_controller.handlers_dict, init_controller=True)
-
-    ascii_keyboard = AsciiKeyboard()
-    ascii_keyboard.highlight = {"d": ('<', '>'), "k": ('<', '>')}
-
-    def on_state_changed(keyboard_controller):
-        current_keys = keyboard_controller.current_key
-        shift = keyboard_controller.shift
-        caps_lock = keyboard_controller.caps_lock
-        extended = keyboard_controller.extended
+    def __init__(self, layout=None, title=None):
+        """
+        :param title: line drawn above, to tell the gamepads apart
+        """
+        self.title = title
+        self.layout = layout
+        self.mode = "mouse"
+        # the keyboard is drawn over the lower part of the DualShock after the first key selection
+        self.keyboard_visible = False
+        # keyboard handler, created on the first switch to the keyboard mode
+        self.keyboard = None
+        self.ascii_keyboard = AsciiKeyboard(layout)
+        if layout is None:
+            layout = KeyboardControllerEventHandler.DEFAULT_KEYBOARD_LAYOUT
+        # the middle keys of the sticks, selected at rest
+        self.ascii_keyboard.highlight = {layout[left_right][1][2]: ('<', '>') for left_right in ("left", "right")}
 
-        ascii_keyboard.shift = shift
-        ascii_keyboard.caps_lock = caps_lock
-        ascii_keyboard.extended = extended
+    def switched(self, mode):
+        self.mode = mode
+        self.keyboard_visible = False
+
+    def state_changed(self, keyboard_controller):
+        """Highlight the keys selected by the sticks"""
+        current_keys = keyboard_controller.current_key
+        ascii_keyboard = self.ascii_keyboard
+        ascii_keyboard.shift = keyboard_controller.shift
+        ascii_keyboard.caps_lock = keyboard_controller.caps_lock
+        ascii_keyboard.extended = keyboard_controller.extended
 
         highlight = {}
         for left_right in current_keys:
             if current_keys[left_right] == "":
-                if left_right == "left":
-                    default_highlight = "5" if ascii_keyboard.extended else "d"
-                    highlight[default_highlight] = ('<', '>')
-                else:
-                    default_highlight = "'" if ascii_keyboard.extended else "k"
-                    highlight[default_highlight] = ('<', '>')
+                highlight[keyboard_controller.keyboard_layout[left_right][1][2]] = ('<', '>')
             else:
                 highlight[current_keys[left_right]] = ('[', ']')
         ascii_keyboard.highlight = highlight
-        if switch_handler.current == "keyboard":
-            print('\033[12F')
-            print(ascii_keyboard)
-    keyboard.on_state_changed = on_state_changed
 
-    print(create_ascii_dualshock("mouse"))
+    def render(self):
+        lines = str(create_ascii_dualshock(self.mode, self.layout)).split('\n')
+        if self.keyboard_visible:
+            lines = lines[:12] + str(self.ascii_keyboard).split('\n')
+            if self.keyboard.completer is not None:
+                lines.append('Options: ' + '  '.join(self.keyboard.completer.completions))
+        if self.title is not None:
+            lines.insert(0, self.title)
+        return '\n'.join(lines)
+
+
+def create_keyboard(output, settings=None):
+    """Keyboard handler with the completion and snippets of the config"""
+    if settings is None:
+        settings = config
+    completer = None
+    if getattr(settings, "COMPLETION_DICTIONARY", None):
+        from completion import CompletionTrie, WordCompleter
+        completer = WordCompleter(CompletionTrie.load(settings.COMPLETION_DICTIONARY),
+                                  getattr(settings, "COMPLETION_COUNT", 3))
+    snippets = None
+    if getattr(settings, "SNIPPETS", None):
+        from snippets import SnippetExpander
+        snippets = SnippetExpander(settings.SNIPPETS)
+    prepare = getattr(output, 'prepare', None)
+    if prepare is not None:
+        prepare()
+    return KeyboardControllerEventHandler(config=settings, output=output, completer=completer, snippets=snippets)
+
+
+class Device:
+    """Mouse and keyboard handlers of one gamepad switched by its JOY_BUTTON_SWITCH"""
+
+    def __init__(self, output, settings=None, on_switch=None, lazy_keyboard=False, on_keyboard=None):
+        """
+        :param settings: config of the gamepad, see compiled_config.profile()
+        :param on_switch: callable(mode) called when the mode is switched
+        :param lazy_keyboard: create the keyboard handler on the first switch to the keyboard mode,
+                              or on the first event the mouse mode leaves to it (Return, Esc, arrows...)
+        :param on_keyboard: callable(keyboard handler) called once the keyboard handler is created
+        """
+        if settings is None:
+            settings = config
+        self.output = output
+        self.settings = settings
+        self.on_switch = on_switch
+        self.on_keyboard = on_keyboard
+
+        self.mouse = MouseControllerEventHandler(config=settings, output=output)
+        self.keyboard = None
+
+        self.switch_handler = JoyButtonSwitchEventHandler(["mouse", "keyboard"],
+            button=getattr(settings, "JOY_BUTTON_SWITCH", 13),
+            on_switch=self._switched
+        )
+        self.switch_controller = SwitchControllerEventHandler(self.switch_handler, {
+            "mouse": self.mouse.handlers_dict,
+            # until the keyboard handler exists, its events create it
+            "keyboard": {event_type: [self._keyboard_event] for event_type in (
+                pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYHATMOTION,
+            )},
+        }, "mouse", OrderedDict([
+            ("mouse", {
+                pygame.JOYBUTTONDOWN: self.mouse.buttons_used,
+                pygame.JOYBUTTONUP: self.mouse.buttons_used,
+                pygame.JOYAXISMOTION: self.mouse.axes_used
+            }),
+            ("keyboard", {
+                pygame.JOYAXISMOTION: tuple(range(6)),
+                pygame.JOYBUTTONDOWN: tuple(range(16)),
+                pygame.JOYBUTTONUP: tuple(range(16)),
+                pygame.JOYHATMOTION: (0, ),
+            })
+        ]))
+        self.handlers_dict = self.switch_controller.handlers_dict
+
+        if not lazy_keyboard:
+            self.load_keyboard()
+
+        self.axis_filter = None
+        if getattr(settings, "AXIS_FILTER", False):
+            from axis_filter import OneEuroFilter
+            keyboard_axes = getattr(settings, "JOY_AXIS", KeyboardControllerEventHandler.JOY_AXIS)
+            self.axis_filter = OneEuroFilter(
+                set(self.mouse.LEFT_AXIS + self.mouse.RIGHT_AXIS + keyboard_axes),
+                min_cutoff=getattr(settings, "AXIS_FILTER_MIN_CUTOFF", 1.0),
+                beta=getattr(settings, "AXIS_FILTER_BETA", 5.0),
+                d_cutoff=getattr(settings, "AXIS_FILTER_D_CUTOFF", 10.0),
+                center_threshold=keyboard_axis_thr(settings),
+            )
+
+    def load_keyboard(self):
+        self.keyboard = create_keyboard(self.output, self.settings)
+        self.switch_controller.handler_dict_map = {
+            "mouse": self.mouse.handlers_dict,
+            "keyboard": self.keyboard.handlers_dict,
+        }
+        if self.on_keyboard is not None:
+            self.on_keyboard(self.keyboard)
+
+    def _keyboard_event(self, event):
+        if self.keyboard is None:
+            self.load_keyboard()
+        for handler in self.keyboard.handlers_dict[event.type]:
+            handler(event)
+
+    def _switched(self, value):
+        if value == "keyboard" and self.keyboard is None:
+            self.load_keyboard()
+        if self.on_switch is not None:
+            self.on_switch(value)
+
+    def release_all(self):
+        """Release what the handlers hold, the gamepad was removed"""
+        self.mouse.release_all()
+        if self.keyboard is not None:
+            self.keyboard.release_all()
+
+
+def keyboard_axis_thr(settings):
+    # the keyboard handler's deadzone decides when a stick is centered and a key is committed
+    return getattr(settings, "DEFAULT_AXIS_THR", KeyboardControllerEventHandler.DEFAULT_AXIS_THR)
+
+
+def coalesce_threshold():
+    return keyboard_axis_thr(config) if getattr(config, "COALESCE_AXIS_EVENTS", True) else None
+
+
+def coalesce_sticks():
+    """(x axis, y axis) of the sticks of the keyboard and mouse modes, other axes are never coalesced"""
+    keyboard_axes = tuple(getattr(config, "JOY_AXIS", KeyboardControllerEventHandler.JOY_AXIS))
+    return (keyboard_axes[:2], keyboard_axes[2:4],
+            tuple(getattr(config, "LEFT_AXIS", MouseControllerEventHandler.LEFT_AXIS)),
+            tuple(getattr(config, "RIGHT_AXIS", MouseControllerEventHandler.RIGHT_AXIS)))
+
+
+def create_controller(output, on_switch=None, init_controller=True, input_source=None, lazy_keyboard=False,
+                      on_keyboard=None):
+    """
+    Create mouse and keyboard handlers of a single gamepad switched by JOY_BUTTON_SWITCH
 
-    clock = pygame.time.Clock()
-    while True:
-        for event in pygame.event.get():
-            joystick.process_event(event)
-        mouse.main_loop_iteration()
-        clock.tick(60)
+    :param input_source: see controller.Controller
+    :param lazy_keyboard: create the keyboard handler when it is first needed, see Device
+    :param on_keyboard: callable(keyboard handler) called once the keyboard handler is created
+
+    :return: (joystick controller, switch handler, mouse handler,
+              keyboard handler or None if lazy_keyboard)
+    """
+    device = Device(output, on_switch=on_switch, lazy_keyboard=lazy_keyboard, on_keyboard=on_keyboard)
+    joystick = JoystickController(device.handlers_dict, init_controller=init_controller,
+                                  input_source=input_source, coalesce_threshold=coalesce_threshold(),
+                                  coalesce_sticks=coalesce_sticks(), axis_filter=device.axis_filter,
+                                  on_disconnect=device.release_all)
+    return joystick, device.switch_handler, device.mouse, device.keyboard
+
+
+def keyboard_layouts(settings):
+    """DEFAULT_KEYBOARD_LAYOUT and EXTENDED_KEYBOARD_LAYOUT of the settings"""
+    return [getattr(settings, name, getattr(KeyboardControllerEventHandler, name))
+            for name in ('DEFAULT_KEYBOARD_LAYOUT', 'EXTENDED_KEYBOARD_LAYOUT')]
+
+
+def print_latency_report(*_):
+    print(latency.report(), file=sys.stderr)
+
+
+def start_latency_report(interval=None):
+    """Enable latency tracking, dump the report on SIGUSR1 and every interval seconds"""
+    latency.enabled = True
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, print_latency_report)
+
+    if interval:
+        def dump():
+            while True:
+                time.sleep(interval)
+                print_latency_report()
+        threading.Thread(target=dump, name='LatencyReport', daemon=True).start()
+
+
+def main(record=None, evdev_device=None, hidraw_device=None, uinput=False, profiler=None):
+    """
+    :param profiler: startup_profile.StartupProfiler, its report is printed to stderr
+                     once the event loop starts
+    """
+    def mark(stage):
+        if profiler is not None:
+            profiler.mark(stage)
+
+    if uinput:
+        from uinput_output import UinputOutput, check_layouts
+        for index in range(max(1, len(getattr(config, 'PROFILES', ())))):
+            check_layouts(*keyboard_layouts(profile(config, index)))
+        output = QueuedOutput(UinputOutput(buffered=True))
+    else:
+        output = QueuedOutput(DirectOutput())
+    output.start()
+    mark('output')
+
+    overlay = TerminalRenderer(refresh_rate=getattr(config, "OVERLAY_REFRESH_RATE", 30))
+    # evdev and hidraw read a single gamepad
+    multiple = evdev_device is None and hidraw_device is None
+    # the overlay follows the gamepad used last
+    views = []
+    # mice of the gamepads without a MouseIntegrator, moved on the ticks of the event loop
+    ticked_mice = []
+    # handlers of every gamepad, their held keys are released at exit
+    devices = []
+
+    def show(view):
+        overlay.show(view.render)
+
+    def create_device(slot):
+        """Handlers and overlay of the gamepad in slot, with its config profile"""
+        settings = profile(config, slot)
+        view = DeviceView(getattr(settings, "DEFAULT_KEYBOARD_LAYOUT", None),
+                          'Gamepad {}'.format(slot + 1) if multiple else None)
+        views.append(view)
+
+        def on_switch(value):
+            view.switched(value)
+            show(view)
+
+        def on_state_changed(keyboard_controller):
+            view.state_changed(keyboard_controller)
+            if device.switch_handler.current == "keyboard":
+                view.keyboard_visible = True
+                show(view)
+
+        def on_keyboard(keyboard_controller):
+            view.keyboard = keyboard_controller
+            keyboard_controller.on_state_changed = on_state_changed
+
+        device = Device(output, settings, on_switch=on_switch, lazy_keyboard=True, on_keyboard=on_keyboard)
+        devices.append(device)
+        if device.mouse.MOUSE_INTEGRATOR_RATE:
+            MouseIntegrator(device.mouse).start()
+        else:
+            ticked_mice.append(device.mouse)
+        show(view)
+        return device
+
+    if evdev_device is not None:
+        from evdev_input import EvdevInput
+        input_source = EvdevInput(evdev_device or None)
+    elif hidraw_device is not None:
+        from ds4_hid import DS4HidInput
+        input_source = DS4HidInput(hidraw_device or None)
+    else:
+        input_source = None
+
+    if multiple:
+        # every gamepad pygame reports gets its own handlers, all of them share the output queue
+        joystick = JoystickController(init_controller=True, coalesce_threshold=coalesce_threshold(),
+                                      coalesce_sticks=coalesce_sticks(), device_factory=create_device)
+    else:
+        device = create_device(0)
+        joystick = JoystickController(device.handlers_dict, input_source=input_source,
+                                      coalesce_threshold=coalesce_threshold(), coalesce_sticks=coalesce_sticks(),
+                                      axis_filter=device.axis_filter,
+                                      on_disconnect=device.release_all)
+    if record is not None:
+        from recording import EventRecorder
+        recorder = EventRecorder(open(record, 'wb'))
+        recorder.attach(joystick)
+    mark('controller')
+
+    if not views:
+        # no gamepad connected yet
+        show(DeviceView())
+    mark('overlay')
+
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
+        profiler.uninstall()
+
+    def tick():
+        for mouse in ticked_mice:
+            mouse.main_loop_iteration()
+
+    try:
+        joystick.listen(on_tick=tick, is_active=lambda: any(mouse.is_active for mouse in ticked_mice))
+    finally:
+        for device in devices:
+            device.release_all()
+        # inject what is still queued, then close the backend (the uinput device)
+        output.stop()
+        if record is not None:
+            recorder.close()
+        if latency.enabled:
+            print_latency_report()
+            if joystick.coalesce_threshold is not None:
+                print('coalescing dropped {} of {} events'.format(
+                    joystick.events_dropped, joystick.events_received
+                ), file=sys.stderr)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Emulate mouse and keyboard with DualShock 4')
+    parser.add_argument('--record', metavar='FILE',
+                        help='record joystick events to FILE, see recording.py')
+    parser.add_argument('--evdev', nargs='?', const='', metavar='DEVICE',
+                        help='read the gamepad from /dev/input/event* instead of pygame (Linux), '
+                             'the first gamepad found if DEVICE is not given')
+    parser.add_argument('--hidraw', nargs='?', const='', metavar='DEVICE',
+                        help='decode DualShock 4 HID reports from /dev/hidraw* instead of pygame (Linux), '
+                             'the first DualShock 4 found if DEVICE is not given')
+    parser.add_argument('--uinput', action='store_true',
+                        help='inject keyboard and mouse events through a /dev/uinput virtual device (Linux)')
+    parser.add_argument('--latency', action='store_true',
+                        help='measure input latency, the report is printed to stderr '
+                             'on SIGUSR1 and on exit')
+    parser.add_argument('--latency-interval', type=float, metavar='SECONDS',
+                        help='also print the latency report every SECONDS')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='print the time spent importing each package and in every '
+                             'initialization stage to stderr when the event loop starts')
+    args = parser.parse_args()
+
+    if args.latency or args.latency_interval:
+        start_latency_report(args.latency_interval)
+    if startup_profiler is not None:
+        startup_profiler.mark('arguments')
+
+    main(record=args.record, evdev_device=args.evdev, hidraw_device=args.hidraw, uinput=args.uinput,
+         profiler=startup_profiler)
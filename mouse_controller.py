@@ -7,9 +7,43 @@
 
 from collections import defaultdict
 
+import threading
+import time
 import pygame
-import mouse
-from controller import Controller as JoystickController
+from functools import partial
+
+from compiled_config import apply_config
+from controller import Controller as JoystickController, compile_button_actions
+from output import DirectOutput
+from latency import tracker as latency
+
+
+class Accumulator:
+    """
+    Accumulates fractional 2D deltas and emits only whole output units,
+    carrying the remainders over to the next call
+    """
+
+    def __init__(self, resolution=1):
+        """
+        :param resolution: output units per 1.0 of input
+        """
+        self.resolution = resolution
+        self.reset()
+
+    def reset(self):
+        self.x = 0.0
+        self.y = 0.0
+
+    def add(self, x, y):
+        """Add a delta, return (dx, dy) whole output units to emit"""
+        x = self.x + x * self.resolution
+        y = self.y + y * self.resolution
+        dx, dy = int(x), int(y)
+        self.x = x - dx
+        self.y = y - dy
+        return dx, dy
+
 
 class MouseControllerEventHandler:
     """Controller event handler which performs mouse control"""
@@ -25,16 +59,30 @@ class MouseControllerEventHandler:
     JOY_BUTTON_RIGHT_MOUSE_CLICK = 5
     JOY_SCROLL_MODE = {'type': 'button', 'value': 7}
 
-    def __init__(self, left_axis_speed=None, right_axis_speed=None, axis_thr=None, config=None):
-        """Initialize the event handler"""
+    # main_loop_iteration rate for MouseIntegrator, 0 to tick in the event loop
+    MOUSE_INTEGRATOR_RATE = 500
+    # axis speeds are in cursor units per frame at this frame rate
+    REFERENCE_RATE = 60
+
+    def __init__(self, left_axis_speed=None, right_axis_speed=None, axis_thr=None, config=None, output=None):
+        """
+        Initialize the event handler
+
+        :param output: output backend, see output.py, DirectOutput by default
+        """
 
-        self._mouse_wheel = getattr(mouse._os_mouse, '__wheel', lambda _, y: mouse.wheel(y))
+        if output is None:
+            output = DirectOutput()
+        self.output = output
         self.scroll_mode = False
+        # mouse buttons pressed and not released yet
+        self._held = set()
         self.axis = defaultdict(lambda: 0)
+        self.wakeup = threading.Event()
+        self._cursor_accumulator = Accumulator()
+        self._wheel_accumulator = Accumulator(output.wheel_resolution)
 
-        for attr in dir(config):
-            if hasattr(self, attr):
-                setattr(self, attr, getattr(config, attr))
+        apply_config(self, config)
 
         if left_axis_speed is None:
             left_axis_speed = self.DEFAULT_LEFT_AXIS_SPEED
@@ -48,32 +96,67 @@ class MouseControllerEventHandler:
             axis_thr = self.DEFAULT_AXIS_THR
         self.axis_thr = axis_thr
 
-    def _button_down_event(self, event):
-        if event.button == self.JOY_BUTTON_LEFT_MOUSE_CLICK:
-            mouse.press('left')
+        # immutable snapshot of LEFT_AXIS + RIGHT_AXIS values, replaced as a
+        # whole by the event thread so MouseIntegrator can read it without locks
+        self.axis_state = (0, ) * len(self.LEFT_AXIS + self.RIGHT_AXIS)
 
-        elif event.button == self.JOY_BUTTON_RIGHT_MOUSE_CLICK:
-            mouse.press('right')
+        self.compile_buttons()
 
-        elif (self.JOY_SCROLL_MODE.get('type') == 'button' and
-                event.button == self.JOY_SCROLL_MODE['value']):
-            self.scroll_mode = True
+    def _set_scroll_mode(self, value):
+        self.scroll_mode = value
 
-    def _button_up_event(self, event):
-        if event.button == self.JOY_BUTTON_LEFT_MOUSE_CLICK:
-            mouse.release('left')
+    def _mouse_down(self, name):
+        self.output.mouse_press(name)
+        self._held.add(name)
+
+    def _mouse_up(self, name):
+        self.output.mouse_release(name)
+        self._held.discard(name)
+
+    def release_all(self):
+        """Release the mouse buttons held and stop the cursor, e.g. when the gamepad is disconnected"""
+        for name in self._held:
+            self.output.mouse_release(name)
+        self._held.clear()
+        self.scroll_mode = False
+        self.axis.clear()
+        self.axis_state = (0, ) * len(self.axis_state)
+        self._cursor_accumulator.reset()
+        self._wheel_accumulator.reset()
+
+    def compile_buttons(self):
+        """Build the button dispatch table, call again after changing JOY_* attributes"""
+        def mouse_button(button, name):
+            return button, partial(self._mouse_down, name), partial(self._mouse_up, name)
+
+        actions = [
+            mouse_button(self.JOY_BUTTON_LEFT_MOUSE_CLICK, 'left'),
+            mouse_button(self.JOY_BUTTON_RIGHT_MOUSE_CLICK, 'right'),
+        ]
+        if self.JOY_SCROLL_MODE.get('type') == 'button':
+            actions.append((
+                self.JOY_SCROLL_MODE['value'],
+                partial(self._set_scroll_mode, True), partial(self._set_scroll_mode, False)
+            ))
+        self._button_actions = compile_button_actions(*actions)
 
-        elif event.button == self.JOY_BUTTON_RIGHT_MOUSE_CLICK:
-            mouse.release('right')
+    def _button_down_event(self, event):
+        actions = self._button_actions.get(event.button)
+        if actions is not None:
+            actions[0]()
 
-        elif (self.JOY_SCROLL_MODE.get('type') == 'button' and
-                event.button == self.JOY_SCROLL_MODE['value']):
-            self.scroll_mode = False
+    def _button_up_event(self, event):
+        actions = self._button_actions.get(event.button)
+        if actions is not None:
+            actions[1]()
 
     def _axis_move_event(self, event):
         if event.axis in self.LEFT_AXIS + self.RIGHT_AXIS:
             self.axis[event.axis] = event.value
-        
+            self.axis_state = tuple(self.axis[k] for k in self.LEFT_AXIS + self.RIGHT_AXIS)
+            if self.is_active:
+                self.wakeup.set()
+
         elif (self.JOY_SCROLL_MODE.get('type') == 'axis' and
                 event.axis == self.JOY_SCROLL_MODE['value']):
             if not self.scroll_mode and event.value > -0.85:
@@ -82,19 +165,41 @@ class MouseControllerEventHandler:
             elif self.scroll_mode and event.value < -0.95:
                 self.scroll_mode = False
 
-    def main_loop_iteration(self):
-        values = [self.axis[k] for k in self.LEFT_AXIS + self.RIGHT_AXIS]
-        values = [x if abs(x) > self.axis_thr else 0 for x in values]
+    @property
+    def is_active(self):
+        """Whether any stick is deflected, i.e. main_loop_iteration has work to do"""
+        axis_thr = self.axis_thr
+        return any(abs(x) > axis_thr for x in self.axis_state)
+
+    def main_loop_iteration(self, dt=None):
+        """
+        Move the cursor (or scroll) according to the current axis state
+
+        :param dt: time in seconds since the previous call, one frame at
+                   REFERENCE_RATE if not given
+        """
+        if dt is None:
+            dt = 1 / self.REFERENCE_RATE
+        values = [x if abs(x) > self.axis_thr else 0 for x in self.axis_state]
+        scale = 100 * self.REFERENCE_RATE * dt
 
         # cursor axis
-        axis0 = values[0] * self.left_axis_speed + values[2] * self.right_axis_speed
-        axis1 = values[1] * self.left_axis_speed + values[3] * self.right_axis_speed
+        axis0 = (values[0] * self.left_axis_speed + values[2] * self.right_axis_speed) * scale
+        axis1 = (values[1] * self.left_axis_speed + values[3] * self.right_axis_speed) * scale
 
         if abs(axis0) > 0 or abs(axis1) > 0:
+            # the OS backends truncate to ints, so emit whole units only
             if self.scroll_mode:
-                self._mouse_wheel(axis0 * 100, axis1 * 100)
+                dx, dy = self._wheel_accumulator.add(axis0, axis1)
+                if dx or dy:
+                    self.output.mouse_wheel(dx, dy)
             else:
-                mouse.move(axis0 * 100, axis1 * 100, absolute=False)
+                dx, dy = self._cursor_accumulator.add(axis0, axis1)
+                if dx or dy:
+                    self.output.mouse_move(dx, dy)
+        else:
+            self._cursor_accumulator.reset()
+            self._wheel_accumulator.reset()
 
     @property
     def handlers_dict(self):
@@ -119,13 +224,61 @@ class MouseControllerEventHandler:
         return used
 
 
+class MouseIntegrator(threading.Thread):
+    """
+    Thread calling MouseControllerEventHandler.main_loop_iteration at a fixed
+    rate, independent of the pygame event loop.
+
+    Motion is scaled by the real elapsed time, so cursor speed doesn't depend
+    on the rate or on scheduling jitter. The thread sleeps on handler.wakeup
+    while the sticks are centered.
+    """
+
+    # cap on dt, e.g. after the machine was suspended
+    MAX_DT = 0.1
+    IDLE_TIMEOUT = 0.5
+
+    def __init__(self, handler, rate=None):
+        super().__init__(name='MouseIntegrator', daemon=True)
+        if rate is None:
+            rate = handler.MOUSE_INTEGRATOR_RATE
+        self.handler = handler
+        self.rate = rate
+        self.running = False
+
+    def run(self):
+        handler = self.handler
+        period = 1 / self.rate
+        self.running = True
+
+        last = time.perf_counter()
+        while self.running:
+            handler.wakeup.clear()
+            if not handler.is_active:
+                handler.wakeup.wait(self.IDLE_TIMEOUT)
+                last = time.perf_counter()
+                continue
+
+            now = time.perf_counter()
+            if latency.enabled:
+                latency.begin(now)
+            handler.main_loop_iteration(min(now - last, self.MAX_DT))
+            last = now
+
+            delay = period - (time.perf_counter() - now)
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running = False
+        self.handler.wakeup.set()
+
+
 if __name__ == "__main__":
     m = MouseControllerEventHandler()
     c = JoystickController(m.handlers_dict, init_controller=True)
-
-    clock = pygame.time.Clock()
-    while True:
-        for event in pygame.event.get():
-            c.process_event(event)
-        m.main_loop_iteration()
-        clock.tick(60)
+    if m.MOUSE_INTEGRATOR_RATE:
+        MouseIntegrator(m).start()
+        c.listen()
+    else:
+        c.listen(on_tick=m.main_loop_iteration, is_active=lambda: m.is_active)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+import platform
+import threading
+import time
+import traceback
+
+import mouse
+
+from latency import instrumented, tracker as latency
+
+
+class DirectOutput:
+    """
+    Output backend injecting events synchronously with keyboard and mouse packages
+
+    The keyboard package is imported by prepare(), on the first key at the latest,
+    so starting in mouse mode doesn't wait for it.
+    """
+
+    def __init__(self):
+        self._keyboard = None
+        self._wheel = getattr(mouse._os_mouse, '__wheel', None)
+        if self._wheel is not None:
+            self.wheel_resolution = 1
+        elif platform.system() == 'Windows':
+            # WHEEL_DELTA = 120 units per notch, passed to the OS as they are:
+            # mouse.wheel(y / 120) gives int(y / 120 * 120), which loses a unit for some y
+            self.wheel_resolution = 120
+            self._wheel = self._windows_wheel
+        else:
+            self.wheel_resolution = 1
+            self._wheel = self._linux_wheel
+
+    def prepare(self):
+        """Import the keyboard package"""
+        if self._keyboard is None:
+            import keyboard
+            self._keyboard = keyboard
+        return self._keyboard
+
+    @staticmethod
+    def _windows_wheel(dx, dy):
+        os_mouse = mouse._os_mouse
+        if dy:
+            os_mouse.user32.mouse_event(os_mouse.MOUSEEVENTF_WHEEL, 0, 0, dy, 0)
+        if dx:
+            os_mouse.user32.mouse_event(os_mouse.MOUSEEVENTF_HWHEEL, 0, 0, dx, 0)
+
+    @staticmethod
+    def _linux_wheel(dx, dy):
+        # the mouse package only has a vertical wheel(), write REL_HWHEEL like it writes REL_WHEEL
+        if dy:
+            mouse.wheel(dy)
+        if dx:
+            os_mouse = mouse._os_mouse
+            os_mouse.build_device()
+            os_mouse.device.write_event(os_mouse.EV_REL, os_mouse.REL_HWHEEL, dx if dx > 0 else dx + 2 ** 32)
+
+    @instrumented
+    def press(self, key):
+        (self._keyboard or self.prepare()).press(key)
+
+    @instrumented
+    def release(self, key):
+        (self._keyboard or self.prepare()).release(key)
+
+    @instrumented
+    def send(self, key):
+        (self._keyboard or self.prepare()).send(key)
+
+    @instrumented
+    def write(self, text, erase=0):
+        """
+        Type text, characters are sent as they are, not as key names
+
+        :param erase: characters to delete with backspace first
+        """
+        keyboard = self._keyboard or self.prepare()
+        for _ in range(erase):
+            keyboard.send('backspace')
+        keyboard.write(text)
+
+    @instrumented
+    def mouse_press(self, button):
+        mouse.press(button)
+
+    @instrumented
+    def mouse_release(self, button):
+        mouse.release(button)
+
+    @instrumented
+    def mouse_move(self, dx, dy):
+        mouse.move(dx, dy, absolute=False)
+
+    @instrumented
+    def mouse_wheel(self, dx, dy):
+        """Scroll by (dx, dy) in 1 / wheel_resolution notches"""
+        self._wheel(dx, dy)
+
+
+class QueuedOutput:
+    """
+    Output stage which queues events and injects them from a worker thread,
+    so the event loop never waits for the OS.
+
+    Consecutive mouse moves (and wheel deltas) still waiting in the queue
+    are merged into one call, everything else is injected in order. If the
+    backend has a flush() method, it is called after each batch.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._flush = getattr(backend, 'flush', None)
+        self.wheel_resolution = backend.wheel_resolution
+        self.running = False
+
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def prepare(self):
+        """Load what the backend needs for the keyboard, if anything, see DirectOutput.prepare"""
+        prepare = getattr(self.backend, 'prepare', None)
+        if prepare is not None:
+            prepare()
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='QueuedOutput', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Inject the remaining events, stop the worker thread and close the
+        backend if it has a close() method, e.g. UinputOutput.close()
+
+        :param timeout: seconds to wait for the worker, the backend isn't closed under a worker still running
+        """
+        with self._condition:
+            self.running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+        close = getattr(self.backend, 'close', None)
+        if close is not None:
+            close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self.running and not self._pending:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, []
+
+            for op, args, _ in pending:
+                try:
+                    getattr(self.backend, op)(*args)
+                except Exception:
+                    traceback.print_exc()
+            if self._flush is not None:
+                # buffered backends write the whole batch at once
+                try:
+                    self._flush()
+                except Exception:
+                    traceback.print_exc()
+
+            if latency.enabled:
+                now = time.perf_counter()
+                for _, _, arrival in pending:
+                    if arrival is not None:
+                        latency.record('injection', now - arrival)
+
+    def _arrival(self):
+        if latency.enabled:
+            latency.stamp('decision')
+            return latency.start
+        return None
+
+    def _put(self, op, *args):
+        arrival = self._arrival()
+        with self._condition:
+            self._pending.append((op, args, arrival))
+            self._condition.notify()
+
+    def _put_delta(self, op, dx, dy):
+        arrival = self._arrival()
+        with self._condition:
+            if self._pending and self._pending[-1][0] == op:
+                _, (x, y), first_arrival = self._pending[-1]
+                self._pending[-1] = (op, (x + dx, y + dy), first_arrival or arrival)
+            else:
+                self._pending.append((op, (dx, dy), arrival))
+                self._condition.notify()
+
+    def press(self, key):
+        self._put('press', key)
+
+    def release(self, key):
+        self._put('release', key)
+
+    def send(self, key):
+        self._put('send', key)
+
+    def write(self, text, erase=0):
+        self._put('write', text, erase)
+
+    def mouse_press(self, button):
+        self._put('mouse_press', button)
+
+    def mouse_release(self, button):
+        self._put('mouse_release', button)
+
+    def mouse_move(self, dx, dy):
+        self._put_delta('mouse_move', dx, dy)
+
+    def mouse_wheel(self, dx, dy):
+        self._put_delta('mouse_wheel', dx, dy)
+
+
+class RecordingOutput:
+    """Fake output backend which only records injected events, for tests and replays"""
+
+    def __init__(self, wheel_resolution=1):
+        self.wheel_resolution = wheel_resolution
+        self.events = []
+
+    def press(self, key):
+        self.events.append(('press', key))
+
+    def release(self, key):
+        self.events.append(('release', key))
+
+    def send(self, key):
+        self.events.append(('send', key))
+
+    def write(self, text, erase=0):
+        self.events.append(('write', text, erase))
+
+    def mouse_press(self, button):
+        self.events.append(('mouse_press', button))
+
+    def mouse_release(self, button):
+        self.events.append(('mouse_release', button))
+
+    def mouse_move(self, dx, dy):
+        self.events.append(('mouse_move', dx, dy))
+
+    def mouse_wheel(self, dx, dy):
+        self.events.append(('mouse_wheel', dx, dy))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Record and replay of raw joystick events.
+#
+# File format: MAGIC, VERSION byte, then one RECORD per event:
+#   uint32  time since the previous event, us
+#   uint8   event kind, see KINDS
+#   uint16  joystick instance id
+#   uint8   axis / button / hat index
+#   int16   axis value * 32767 or hat x
+#   int16   hat y
+
+import argparse
+import math
+import struct
+import time
+
+from collections import Counter
+
+import pygame
+
+
+MAGIC = b'DS4REC'
+VERSION = 1
+RECORD = struct.Struct('<IBHBhh')
+
+KINDS = (pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP, pygame.JOYHATMOTION)
+KIND_INDEX = {event_type: i for i, event_type in enumerate(KINDS)}
+
+
+def encode_event(event):
+    """Return (kind, index, value0, value1) or None if the event isn't recorded"""
+    kind = KIND_INDEX.get(event.type)
+    if kind is None:
+        return None
+    if event.type == pygame.JOYAXISMOTION:
+        # SDL axis values are int16, pygame divides them by 32767
+        return kind, event.axis, round(event.value * 32767), 0
+    elif event.type == pygame.JOYHATMOTION:
+        return kind, event.hat, event.value[0], event.value[1]
+    else:
+        return kind, event.button, 0, 0
+
+
+def decode_event(kind, instance_id, index, value0, value1):
+    event_type = KINDS[kind]
+    attrs = {'joy': instance_id, 'instance_id': instance_id}
+    if event_type == pygame.JOYAXISMOTION:
+        attrs.update(axis=index, value=value0 / 32767)
+    elif event_type == pygame.JOYHATMOTION:
+        attrs.update(hat=index, value=(value0, value1))
+    else:
+        attrs.update(button=index)
+    return pygame.event.Event(event_type, attrs)
+
+
+class EventRecorder:
+    """Writes the joystick events a Controller reads to a file"""
+
+    def __init__(self, file):
+        """
+        :param file: binary file object opened for writing
+        """
+        self.file = file
+        self.file.write(MAGIC + bytes([VERSION]))
+        self._last = None
+
+    def record(self, event):
+        encoded = encode_event(event)
+        if encoded is None:
+            return
+        now = time.perf_counter()
+        delta = 0 if self._last is None else round((now - self._last) * 1e6)
+        self._last = now
+        kind, index, value0, value1 = encoded
+        self.file.write(RECORD.pack(
+            min(delta, 0xffffffff), kind, getattr(event, 'instance_id', 0), index, value0, value1
+        ))
+
+    def record_batch(self, events):
+        for event in events:
+            self.record(event)
+
+    def attach(self, controller):
+        """Record every event the controller reads, before coalescing drops any"""
+        controller.batch_listeners.append(self.record_batch)
+
+    def close(self):
+        self.file.close()
+
+
+def read_events(file):
+    """
+    Read a recording
+
+    :param file: binary file object
+    :return: list of (time in seconds since the first event, pygame event)
+    """
+    data = file.read()
+    header = MAGIC + bytes([VERSION])
+    if not data.startswith(header):
+        raise ValueError('not a joystick recording (version {})'.format(VERSION))
+
+    events = []
+    t = 0
+    for delta, *fields in RECORD.iter_unpack(memoryview(data)[len(header):]):
+        t += delta
+        events.append((t / 1e6, decode_event(*fields)))
+    return events
+
+
+def synthesize_typing(text, keyboard, switch_button=None, step=0.004, steps=4):
+    """
+    Generate events typing text with the sticks, for benchmarks without a gamepad
+
+    Every key is a gesture from the center to the key position and back,
+    split into steps axis events in each direction. Characters which are not
+    in the default layout are skipped.
+
+    :param keyboard: KeyboardControllerEventHandler providing the geometry
+    :param switch_button: if given, press it first to switch to keyboard mode
+    :param step: time between events in seconds
+    :return: list of (time, event) like read_events
+    """
+    positions = {}
+    for dist, row in enumerate(keyboard.LOOKUP):
+        for angle, (r, c) in enumerate(row):
+            # inverse of _get_angle / _get_dist, at 0.5 and 1.0 of the L4 norm
+            x = math.cos(angle * math.pi / 4)
+            y = -math.sin(angle * math.pi / 4)
+            scale = (0.5 if dist == 0 else 1.0) / (x ** 4 + y ** 4) ** 0.25
+            for left_right, data in keyboard.DEFAULT_KEYBOARD_LAYOUT.items():
+                positions.setdefault(data[r][c], (left_right, x * scale, y * scale))
+
+    events = []
+    t = 0
+    axis_values = {}
+
+    def add(event_type, **attrs):
+        nonlocal t
+        events.append((t, pygame.event.Event(event_type, joy=0, instance_id=0, **attrs)))
+        t += step
+
+    def move(axis, value):
+        # like SDL, only report changes
+        value = round(value * 32767) / 32767
+        if axis_values.get(axis, 0) != value:
+            axis_values[axis] = value
+            add(pygame.JOYAXISMOTION, axis=axis, value=value)
+
+    if switch_button is not None:
+        add(pygame.JOYBUTTONDOWN, button=switch_button)
+        add(pygame.JOYBUTTONUP, button=switch_button)
+
+    for char in text:
+        if char not in positions:
+            continue
+        left_right, x, y = positions[char]
+        axes = keyboard.LR_TO_JOY_AXIS[left_right]
+        ramp = [i / steps for i in range(1, steps + 1)]
+        for k in ramp + ramp[-2::-1] + [0]:
+            move(axes[0], x * k)
+            move(axes[1], y * k)
+    return events
+
+
+def replay(events, process_event, mouse=None, realtime=False):
+    """
+    Feed recorded events to process_event(event, time)
+
+    The mouse handler is ticked at its MOUSE_INTEGRATOR_RATE in the recording's
+    time, so the output doesn't depend on how fast the replay runs.
+
+    :param events: list of (time, event) as returned by read_events
+    :param mouse: MouseControllerEventHandler to tick between events
+    :param realtime: keep the recorded timing instead of running as fast as possible
+    """
+    if mouse is not None:
+        period = 1 / (mouse.MOUSE_INTEGRATOR_RATE or mouse.REFERENCE_RATE)
+    next_tick = 0
+    start = time.perf_counter()
+    for t, event in events:
+        if mouse is not None:
+            while next_tick <= t:
+                if mouse.is_active:
+                    mouse.main_loop_iteration(period)
+                next_tick += period
+
+        if realtime:
+            delay = t - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        process_event(event, t)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a joystick recording made with main.py --record')
+    parser.add_argument('file', help='recording to replay')
+    parser.add_argument('--realtime', action='store_true',
+                        help='keep the recorded timing instead of replaying as fast as possible')
+    args = parser.parse_args()
+
+    from main import create_controller
+    from output import RecordingOutput
+
+    with open(args.file, 'rb') as f:
+        events = read_events(f)
+
+    output = RecordingOutput()
+    joystick, _, mouse, _ = create_controller(output, init_controller=False)
+    start = time.perf_counter()
+    replay(events, joystick.process_event, mouse, realtime=args.realtime)
+    elapsed = time.perf_counter() - start
+
+    print('{} events replayed in {:.3f}s ({:,.0f} events/sec)'.format(
+        len(events), elapsed, len(events) / elapsed if elapsed else 0
+    ))
+    for op, count in sorted(Counter(e[0] for e in output.events).items()):
+        print('  {:<14} {}'.format(op, count))
+    print('typed: {}'.format(' '.join(e[1] for e in output.events if e[0] == 'send')))
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+import sys
+import threading
+import time
+
+from latency import tracker as latency
+
+
+class TerminalRenderer:
+    """
+    Draws a block of text at the bottom of the terminal and keeps it up to
+    date, writing only the cells which changed since the previous frame.
+
+    Frames are rendered at most refresh_rate times per second, if several
+    frames are requested in between, only the latest one is drawn. Frames
+    which have to wait are drawn by a single thread started on the first one.
+    """
+
+    # unchanged cells shorter than this between two changed runs are
+    # rewritten instead of moving the cursor over them
+    MIN_GAP = 4
+
+    def __init__(self, stream=None, refresh_rate=None):
+        """
+        :param stream: text stream to write to, sys.stdout by default
+        :param refresh_rate: max frames per second, draw every frame if 0 or None
+        """
+        if stream is None:
+            stream = sys.stdout
+        self.stream = stream
+        self.refresh_rate = refresh_rate
+
+        self.frame = None
+        self.writes = 0
+
+        self._pending = None
+        self._last_write = None
+        # a deferred frame is waiting for the drawing thread
+        self._scheduled = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+
+    def show(self, render):
+        """
+        Request a new frame
+
+        :param render: the frame text or a callable() returning it, the
+                       callable isn't called for frames which are skipped
+        """
+        with self._lock:
+            self._pending = render
+            if self._scheduled:
+                # the frame will be drawn by the drawing thread
+                return
+
+            if self._delay() <= 0:
+                self._flush()
+            else:
+                self._scheduled = True
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='TerminalRenderer', daemon=True)
+                    self._thread.start()
+                self._wakeup.notify()
+
+    def flush(self):
+        """Draw the pending frame now"""
+        with self._lock:
+            self._flush()
+
+    def _delay(self):
+        """Seconds until the next frame may be drawn"""
+        if not self.refresh_rate or self._last_write is None:
+            return 0
+        return self._last_write + 1 / self.refresh_rate - time.perf_counter()
+
+    def _run(self):
+        with self._lock:
+            while True:
+                if not self._scheduled:
+                    self._wakeup.wait()
+                    continue
+                delay = self._delay()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                else:
+                    self._flush()
+
+    def _flush(self):
+        self._scheduled = False
+        render, self._pending = self._pending, None
+        if render is None:
+            return
+        start = time.perf_counter()
+        text = render() if callable(render) else render
+        lines = text.split('\n')
+
+        if self.frame is None:
+            output = text + '\n'
+        else:
+            output = self._diff(self.frame, lines)
+
+        self.frame = lines
+        self._last_write = time.perf_counter()
+        if output:
+            self.stream.write(output)
+            self.stream.flush()
+            self.writes += 1
+        if latency.enabled:
+            latency.record('render', time.perf_counter() - start)
+
+    def _diff(self, old, new):
+        """Escape sequence turning old lines into new ones, cursor is on the line after the block"""
+        height = len(old)
+        if len(new) != height:
+            # redraw the whole block
+            return '\033[{}F'.format(height) + ''.join(line + '\033[K\n' for line in new) + '\033[J'
+
+        output = []
+        row = height
+        for r, (old_line, new_line) in enumerate(zip(old, new)):
+            if old_line == new_line:
+                continue
+            runs = self._changed_runs(old_line, new_line)
+            output.append('\033[{}F'.format(row - r) if row > r else '\033[{}E'.format(r - row))
+            row = r
+            for start, end in runs:
+                output.append('\033[{}G'.format(start + 1) + new_line[start:end])
+            if len(new_line) < len(old_line):
+                output.append('\033[{}G\033[K'.format(len(new_line) + 1))
+        if row < height:
+            output.append('\033[{}E'.format(height - row))
+        return ''.join(output)
+
+    def _changed_runs(self, old_line, new_line):
+        """[start, end) ranges of new_line differing from old_line"""
+        runs = []
+        start = None
+        gap = 0
+        for i, c in enumerate(new_line):
+            if i < len(old_line) and old_line[i] == c:
+                gap += 1
+                continue
+            if start is not None and gap < self.MIN_GAP:
+                runs[-1] = (runs[-1][0], i + 1)
+            else:
+                runs.append((i, i + 1))
+            start = i
+            gap = 0
+        return runs
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Text expansion: SNIPPETS = {';sig': 'Best regards,\nAleksandr', ...}
+# replaces a trigger with its expansion as soon as the last character of the
+# trigger is typed.
+#
+# The triggers are matched against the typed characters with an Aho-Corasick
+# automaton, so a key costs the same with a few or thousands of snippets.
+
+import sys
+
+
+# characters of shifted keys, US layout
+SHIFTED = dict(zip("`1234567890-=[]\\;',./", '~!@#$%^&*()_+{}|:"<>?'))
+KEY_CHARACTERS = {'space': ' ', 'tab': '\t', 'return': '\n', 'enter': '\n'}
+
+
+def key_character(key, shift=False):
+    """
+    Character typed by a key sent by KeyboardControllerEventHandler
+
+    :param key: key name as passed to the output, e.g. 'a', 'shift+a', 'space'
+    :param shift: whether shift is held
+    :return: the character, or None for other keys
+    """
+    if key.startswith('shift+') and len(key) == 7:
+        key, shift = key[-1], True
+    if len(key) != 1:
+        return KEY_CHARACTERS.get(key)
+    if shift:
+        return SHIFTED.get(key, key.upper())
+    return key
+
+
+class SnippetExpander:
+    """
+    Follows the keys sent by KeyboardControllerEventHandler and expands the
+    snippet triggers typed
+
+    States are trie nodes of the triggers, a character moves to the longest
+    trigger prefix ending with it. Transitions found through the failure links
+    are added to the state, so every character is a dict lookup after warm-up.
+    """
+
+    def __init__(self, snippets):
+        """
+        :param snippets: {trigger: expansion}
+        """
+        self.snippets = dict(snippets)
+        # state 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        # the longest trigger ending at the state, or None
+        self._match = [None]
+
+        for trigger in self.snippets:
+            if not trigger:
+                raise ValueError('empty snippet trigger')
+            state = 0
+            for c in trigger:
+                next_state = self._goto[state].get(c)
+                if next_state is None:
+                    next_state = self._goto[state][c] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(None)
+                state = next_state
+            self._match[state] = trigger
+
+        # failure links, breadth first so the links of shorter prefixes are known
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for c, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(c, 0)
+                self._fail[child] = fail
+                if self._match[child] is None:
+                    self._match[child] = self._match[fail]
+                queue.append(child)
+        # trie nodes, _next() adds the other transitions to _goto as they are met
+        self.states = len(self._goto)
+        self.max_length = max(map(len, self.snippets), default=0)
+        # states after every typed character, for backspace
+        self._history = [0]
+
+    def reset(self):
+        self._history = [0]
+
+    def _next(self, state, c):
+        transitions = self._goto[state]
+        next_state = transitions.get(c)
+        if next_state is None:
+            fail = state
+            while fail and c not in self._goto[fail]:
+                fail = self._fail[fail]
+            next_state = transitions[c] = self._goto[fail].get(c, 0)
+        return next_state
+
+    def feed(self, key, shift=False):
+        """
+        Track a key sent by the keyboard handler
+
+        :param key: key name as passed to the output
+        :param shift: whether shift is held
+        :return: (characters to erase, expansion) when a trigger is complete, otherwise None
+        """
+        if key == 'backspace':
+            if len(self._history) > 1:
+                self._history.pop()
+            return None
+        c = key_character(key, shift)
+        if c is None:
+            self.reset()
+            return None
+
+        state = self._next(self._history[-1], c)
+        trigger = self._match[state]
+        if trigger is not None:
+            self.reset()
+            return len(trigger), self.snippets[trigger]
+        self._history.append(state)
+        # states only depend on the last max_length characters
+        if len(self._history) > 2 * self.max_length + 1:
+            del self._history[1:self.max_length + 1]
+        return None
+
+
+if __name__ == '__main__':
+    import config
+
+    expander = SnippetExpander(getattr(config, 'SNIPPETS', {}))
+    text = ' '.join(sys.argv[1:])
+    print('{} snippets, {} states'.format(len(expander.snippets), expander.states))
+    typed = ''
+    for c in text:
+        typed += c
+        expansion = expander.feed(c)
+        if expansion is not None:
+            erase, replacement = expansion
+            typed = typed[:-erase] + replacement
+    print(typed)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Startup time report of main.py --profile-startup.
+#
+# Imports are timed by wrapping builtins.__import__, every import statement
+# loading a new module gets its time minus the time of the imports it made
+# itself, summed by top-level package. Initialization stages are the time
+# between two mark() calls.
+
+import builtins
+import sys
+import time
+
+
+class StartupProfiler:
+    """Import times by package and initialization stages, see the module description"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last_mark = self.start
+        # stage name -> seconds, in order
+        self.stages = {}
+        # top-level package -> seconds of import statements loading its modules
+        self.imports = {}
+        # time of the nested imports of the import statements being executed
+        self._nested = []
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        if self._import is not None:
+            builtins.__import__ = self._import
+            self._import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            if level and globals:
+                name = globals.get('__package__') or name
+            package = name.partition('.')[0]
+            self.imports[package] = self.imports.get(package, 0.0) + elapsed - nested
+
+    def mark(self, stage):
+        """End an initialization stage"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last_mark
+        self._last_mark = now
+
+    def report(self, top=15):
+        total = self._last_mark - self.start
+        lines = ['startup: {:.1f} ms'.format(total * 1000), '  stages, ms:']
+        lines += ['{:>10.1f}  {}'.format(seconds * 1000, stage) for stage, seconds in self.stages.items()]
+        lines.append('  imports by package (own time), ms:')
+        imports = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        lines += ['{:>10.1f}  {}'.format(seconds * 1000, package) for package, seconds in imports[:top]]
+        if len(imports) > top:
+            lines.append('{:>10.1f}  {} more'.format(sum(seconds for _, seconds in imports[top:]) * 1000,
+                                                    len(imports) - top))
+        return '\n'.join(lines)
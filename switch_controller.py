@@ -10,38 +10,87 @@ import pygame
 from collections import defaultdict
 
 from controller import merge_event_handlers
+from latency import tracker as latency
 
 class defaultdict_get(defaultdict):
     def get(self, key, default=None):
         return self[key]
 
+# event attribute holding the index looked up in supported_events
+INDEX_ATTRS = {
+    pygame.JOYBUTTONDOWN: 'button',
+    pygame.JOYBUTTONUP: 'button',
+    pygame.JOYAXISMOTION: 'axis',
+    pygame.JOYHATMOTION: 'hat',
+}
+
 class SwitchControllerEventHandler:
     def __init__(self, switch_event_handler, handler_dict_map, initial_key=None, supported_events=None):
         self.switch_event_handler = switch_event_handler
-        self.handler_dict_map = handler_dict_map
-        self.supported_events = supported_events
+        self._handler_dict_map = handler_dict_map
+        self._supported_events = supported_events
+        self.compile()
 
         if initial_key is None:
             initial_key = list(handler_dict_map.keys())[0]
         self.current_key = initial_key
 
+        self._handlers_dict = defaultdict_get(lambda: [self._every_event_handler])
+
+    @property
+    def handler_dict_map(self):
+        return self._handler_dict_map
+
+    @handler_dict_map.setter
+    def handler_dict_map(self, value):
+        self._handler_dict_map = value
+        self.compile()
+
+    @property
+    def supported_events(self):
+        return self._supported_events
+
+    @supported_events.setter
+    def supported_events(self, value):
+        self._supported_events = value
+        self.compile()
+
     @staticmethod
     def _no_action_event_handler(event):
         pass
 
-    def _is_supported(self, key, event):
-        supported = False
-        if self.supported_events is not None:
-            if event.type in self.supported_events[key]:
-                if event.type in (pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP):
-                    supported = event.button in self.supported_events[key][event.type]
-                elif event.type == pygame.JOYAXISMOTION:
-                    supported = event.axis in self.supported_events[key][event.type]
-                elif event.type == pygame.JOYHATMOTION:
-                    supported = event.hat in self.supported_events[key][event.type]
-        else:
-            supported = True
-        return supported
+    def compile(self):
+        """
+        Build the dispatch table of every mode
+
+        For each mode the table maps (event type, index) to the handlers
+        which process it: the mode's own handlers if the mode supports the
+        event, otherwise the handlers of the first mode supporting it. Events
+        no mode supports are handled by the current mode.
+
+        Called automatically when handler_dict_map or supported_events is
+        assigned, call it after changing them in place.
+        """
+        no_action = (self._no_action_event_handler, )
+
+        # (event type, index) -> modes supporting it, in supported_events order
+        supported = {}
+        if self._supported_events is not None:
+            for key, events in self._supported_events.items():
+                for event_type, indexes in events.items():
+                    if event_type in INDEX_ATTRS:
+                        for index in indexes:
+                            supported.setdefault((event_type, index), []).append(key)
+
+        self._dispatch = {}
+        for key, handlers_dict in self._handler_dict_map.items():
+            table = {}
+            for (event_type, index), keys in supported.items():
+                mode = key if key in keys else keys[0]
+                table[event_type, index] = tuple(
+                    self._handler_dict_map[mode].get(event_type, no_action)
+                )
+            self._dispatch[key] = (table, handlers_dict)
 
     def _every_event_handler(self, event):
         switch_value = self.switch_event_handler(event)
@@ -49,19 +98,19 @@ class SwitchControllerEventHandler:
         if switch_value is not None:
             self.current_key = switch_value
         else:
-            current_key = self.current_key
-            if not self._is_supported(current_key, event):
-                for key in self.supported_events:
-                    if self._is_supported(key, event):
-                        current_key = key
-                        break
-            # if found nothing still use self.current_key
-
-            handlers_dict = self.handler_dict_map[current_key]
-            event_handlers = handlers_dict.get(event.type, [self._no_action_event_handler])
+            table, handlers_dict = self._dispatch[self.current_key]
+            attr = INDEX_ATTRS.get(event.type)
+            event_handlers = None
+            if attr is not None:
+                event_handlers = table.get((event.type, getattr(event, attr)))
+            if event_handlers is None:
+                event_handlers = handlers_dict.get(event.type, [self._no_action_event_handler])
+
+            if latency.enabled:
+                latency.stamp('routing')
             for handler in event_handlers:
                 handler(event)
 
     @property
     def handlers_dict(self):
-        return defaultdict_get(lambda: [self._every_event_handler])
+        return self._handlers_dict
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2020 Aleksandr Zuev <zuev08@gmail.com>
+#
+# Distributed under terms of the MIT license.
+#
+# Linux output backend injecting keyboard and mouse events through a
+# virtual device created with /dev/uinput.
+#
+# Key names and characters are translated to evdev key codes assuming a US
+# layout, the codes are physical keys and the desktop applies its own
+# layout to them. Every call is one input frame (write() one per character):
+# its input_event structs followed by a single SYN_REPORT, written with one
+# write() call, or kept until flush() if the backend is buffered.
+
+import fcntl
+import os
+import struct
+
+from evdev_input import INPUT_EVENT, EV_SYN, EV_KEY, SYN_REPORT
+from latency import instrumented
+
+
+EV_REL = 0x02
+REL_X = 0x00
+REL_Y = 0x01
+REL_HWHEEL = 0x06
+REL_WHEEL = 0x08
+REL_WHEEL_HI_RES = 0x0b
+REL_HWHEEL_HI_RES = 0x0c
+# one wheel notch in REL_*_HI_RES units
+WHEEL_HI_RES = 120
+
+BTN_LEFT = 0x110
+BTN_RIGHT = 0x111
+BTN_MIDDLE = 0x112
+MOUSE_BUTTONS = {'left': BTN_LEFT, 'right': BTN_RIGHT, 'middle': BTN_MIDDLE}
+
+BUS_VIRTUAL = 0x06
+# struct uinput_setup {struct input_id {__u16 bustype, vendor, product, version}; char name[80]; __u32 ff_effects_max;}
+UINPUT_SETUP = struct.Struct('4H80sI')
+DEVICE_NAME = b'python-ds4'
+
+KEY_CODES = {
+    'esc': 1, 'backspace': 14, 'tab': 15, 'enter': 28, 'return': 28, 'space': 57,
+    'ctrl': 29, 'left ctrl': 29, 'right ctrl': 97,
+    'shift': 42, 'left shift': 42, 'right shift': 54,
+    'alt': 56, 'left alt': 56, 'right alt': 100, 'alt gr': 100,
+    'command': 125, 'windows': 125, 'left windows': 125, 'right windows': 126,
+    'caps lock': 58, 'delete': 111, 'insert': 110, 'home': 102, 'end': 107,
+    'page up': 104, 'page down': 109,
+    'up': 103, 'left': 105, 'right': 106, 'down': 108,
+}
+KEY_CODES.update({'f{}'.format(i): 58 + i for i in range(1, 11)})
+KEY_CODES.update({'f11': 87, 'f12': 88})
+# character -> key code, the shifted character of each key follows it
+_US_KEYS = (
+    (2, '1!2@3#4$5%6^7&8*9(0)-_=+'),
+    (16, 'qQwWeErRtTyYuUiIoOpP[{]}'),
+    (30, 'aAsSdDfFgGhHjJkKlL;:\'"`~'),
+    (43, '\\|zZxXcCvVbBnNmM,<.>/?'),
+)
+CHARACTERS = {}
+for _first, _chars in _US_KEYS:
+    for _i in range(0, len(_chars), 2):
+        CHARACTERS[_chars[_i]] = (_first + _i // 2, False)
+        CHARACTERS[_chars[_i + 1]] = (_first + _i // 2, True)
+CHARACTERS.update({' ': (57, False), '\t': (15, False), '\n': (28, False)})
+# KEY_102ND, the key left of 1 on ISO keyboards of the Mac, in EXTENDED_KEYBOARD_LAYOUT
+CHARACTERS['§'] = (86, False)
+KEY_LEFTSHIFT = KEY_CODES['shift']
+
+
+def _iow(nr, size):
+    # _IOW('U', nr, size)
+    return (1 << 30) | (size << 16) | (ord('U') << 8) | nr
+
+
+UI_DEV_CREATE = (ord('U') << 8) | 1
+UI_DEV_DESTROY = (ord('U') << 8) | 2
+UI_DEV_SETUP = _iow(3, UINPUT_SETUP.size)
+UI_SET_EVBIT = _iow(100, 4)
+UI_SET_KEYBIT = _iow(101, 4)
+UI_SET_RELBIT = _iow(102, 4)
+
+
+def parse_key(key):
+    """
+    Key codes pressed for a key name, character, scan code or hotkey like 'shift+a'
+
+    :return: tuple of evdev key codes, in press order
+    """
+    if isinstance(key, int):
+        return key,
+    parts = [key] if len(key) == 1 else key.split('+')
+    codes = []
+    for part in parts:
+        if part in CHARACTERS:
+            code, shifted = CHARACTERS[part]
+            if shifted and KEY_LEFTSHIFT not in codes:
+                codes.append(KEY_LEFTSHIFT)
+        elif part.lower() in KEY_CODES:
+            code = KEY_CODES[part.lower()]
+        else:
+            raise ValueError('Key {!r} is not mapped to any known key.'.format(part))
+        if code not in codes:
+            codes.append(code)
+    return tuple(codes)
+
+
+def check_layouts(*layouts):
+    """
+    Raise ValueError for the first character of the keyboard layouts without
+    a key code, so a gap fails at startup instead of dropping the key
+
+    :param layouts: {'left': rows, 'right': rows} like DEFAULT_KEYBOARD_LAYOUT
+    """
+    for layout in layouts:
+        for rows in layout.values():
+            for row in rows:
+                for c in row:
+                    parse_key(c)
+
+
+class UinputOutput:
+    """
+    Output backend writing input_event structs to a uinput virtual device
+
+    :param path: uinput device node
+    :param fd: write the raw input_event stream to this file descriptor
+               instead of creating a device, e.g. a file or a pipe for tests
+    :param buffered: keep the frames until flush() instead of writing every call
+    """
+
+    wheel_resolution = WHEEL_HI_RES
+
+    def __init__(self, path='/dev/uinput', fd=None, buffered=False):
+        self.device = fd is None
+        if self.device:
+            fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            try:
+                self._create_device(fd)
+            except OSError:
+                os.close(fd)
+                raise
+        self.fd = fd
+        self.buffered = buffered
+
+        self._buffer = bytearray()
+        # parsed hotkeys, the handlers send a few dozen different keys
+        self._keys = {}
+        self._pressed = set()
+        # hi-res wheel remainders not yet reported as whole REL_WHEEL notches
+        self._wheel = [0, 0]
+
+    @staticmethod
+    def _create_device(fd):
+        fcntl.ioctl(fd, UI_SET_EVBIT, EV_KEY)
+        for code in set(KEY_CODES.values()) | {code for code, _ in CHARACTERS.values()}:
+            fcntl.ioctl(fd, UI_SET_KEYBIT, code)
+        for code in MOUSE_BUTTONS.values():
+            fcntl.ioctl(fd, UI_SET_KEYBIT, code)
+        fcntl.ioctl(fd, UI_SET_EVBIT, EV_REL)
+        for code in (REL_X, REL_Y, REL_WHEEL, REL_HWHEEL, REL_WHEEL_HI_RES, REL_HWHEEL_HI_RES):
+            fcntl.ioctl(fd, UI_SET_RELBIT, code)
+        fcntl.ioctl(fd, UI_DEV_SETUP, UINPUT_SETUP.pack(BUS_VIRTUAL, 0, 0, 1, DEVICE_NAME, 0))
+        fcntl.ioctl(fd, UI_DEV_CREATE)
+
+    def close(self):
+        """Release the keys still held, destroy the device"""
+        for code in self._pressed:
+            self._event(EV_KEY, code, 0)
+        self._pressed.clear()
+        self._frame()
+        self.flush()
+        if self.device:
+            fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+        os.close(self.fd)
+
+    def flush(self):
+        """Write the buffered frames"""
+        if self._buffer:
+            os.write(self.fd, self._buffer)
+            self._buffer.clear()
+
+    def _event(self, ev_type, code, value):
+        # the kernel sets the timestamps
+        self._buffer += INPUT_EVENT.pack(0, 0, ev_type, code, value)
+
+    def _frame(self):
+        self._event(EV_SYN, SYN_REPORT, 0)
+        if not self.buffered:
+            self.flush()
+
+    def _codes(self, key):
+        codes = self._keys.get(key)
+        if codes is None:
+            codes = self._keys[key] = parse_key(key)
+        return codes
+
+    def _press(self, codes):
+        for code in codes:
+            self._event(EV_KEY, code, 1)
+            self._pressed.add(code)
+
+    def _release(self, codes):
+        for code in reversed(codes):
+            self._event(EV_KEY, code, 0)
+            self._pressed.discard(code)
+
+    @instrumented
+    def press(self, key):
+        self._press(self._codes(key))
+        self._frame()
+
+    @instrumented
+    def release(self, key):
+        self._release(self._codes(key))
+        self._frame()
+
+    @instrumented
+    def send(self, key):
+        # a key pressed and released in the same frame would be lost by some clients
+        codes = self._codes(key)
+        self._press(codes)
+        self._event(EV_SYN, SYN_REPORT, 0)
+        self._release(codes)
+        self._frame()
+
+    @instrumented
+    def write(self, text, erase=0):
+        """
+        Type text, characters are sent as they are, not as key names, with one write() call
+
+        :param erase: characters to delete with backspace first
+        """
+        backspace = (KEY_CODES['backspace'],)
+        for codes in [backspace] * erase + [parse_key(char) for char in text]:
+            self._press(codes)
+            self._event(EV_SYN, SYN_REPORT, 0)
+            self._release(codes)
+            self._event(EV_SYN, SYN_REPORT, 0)
+        if not self.buffered:
+            self.flush()
+
+    @instrumented
+    def mouse_press(self, button):
+        self._event(EV_KEY, MOUSE_BUTTONS[button], 1)
+        self._frame()
+
+    @instrumented
+    def mouse_release(self, button):
+        self._event(EV_KEY, MOUSE_BUTTONS[button], 0)
+        self._frame()
+
+    @instrumented
+    def mouse_move(self, dx, dy):
+        if dx:
+            self._event(EV_REL, REL_X, dx)
+        if dy:
+            self._event(EV_REL, REL_Y, dy)
+        self._frame()
+
+    @instrumented
+    def mouse_wheel(self, dx, dy):
+        """Scroll by (dx, dy) in 1 / wheel_resolution notches"""
+        for i, (delta, hi_res, notches) in enumerate((
+            (dy, REL_WHEEL_HI_RES, REL_WHEEL), (dx, REL_HWHEEL_HI_RES, REL_HWHEEL),
+        )):
+            if not delta:
+                continue
+            self._event(EV_REL, hi_res, delta)
+            # clients without hi-res support only see whole notches
+            self._wheel[i] += delta
+            whole = int(self._wheel[i] / WHEEL_HI_RES)
+            if whole:
+                self._event(EV_REL, notches, whole)
+                self._wheel[i] -= whole * WHEEL_HI_RES
+        self._frame()
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Type text through a uinput virtual keyboard')
+    parser.add_argument('text', help='text to type')
+    parser.add_argument('--delay', type=float, default=1.0,
+                        help='seconds to wait after creating the device, so the desktop picks it up')
+    args = parser.parse_args()
+
+    output = UinputOutput()
+    time.sleep(args.delay)
+    for char in args.text:
+        output.send(char)
+    output.close()